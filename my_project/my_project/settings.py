@@ -12,7 +12,9 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 from dotenv import load_dotenv
+import copy
 import os
+from importlib.util import find_spec
 load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -43,7 +45,20 @@ INSTALLED_APPS = [
     'store'
 ]
 
+# orjson speeds up the JSON renderer when installed; MessagePack is offered
+# to clients that ask for it when msgpack is installed
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'store.renderers.ORJSONRenderer',
+        *(['store.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
 MIDDLEWARE = [
+    'store.metrics.MetricsMiddleware',
+    'store.replicas.ReplicaMiddleware',
+    'store.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +99,51 @@ DATABASES = {
     }
 }
 
+# Read replicas: comma-separated SQLite files in STORE_REPLICA_DATABASES,
+# which receive copies of the default database. Safe requests read from
+# them (see store.replicas); tests use the default database in their place.
+STORE_READ_REPLICAS = []
+for index, path in enumerate(
+    filter(None, os.environ.get('STORE_REPLICA_DATABASES', '').split(',')), start=1
+):
+    DATABASES[f'replica{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    STORE_READ_REPLICAS.append(f'replica{index}')
+DATABASE_ROUTERS = ['store.replicas.ReplicaRouter']
+# Seconds replicas may lag behind: reads filling caches stay on the primary
+# that long after any write, so the caches never take in older rows
+STORE_REPLICA_LAG = 2
+# Seconds a client that wrote keeps reading from the primary
+STORE_REPLICA_PIN_SECONDS = 10
+
+# High-throughput SQLite profile, selected with STORE_SQLITE_PROFILE=tuned.
+# WAL lets readers run next to the single writer, and with it
+# synchronous=NORMAL only risks the last commits on power loss, not
+# corruption. IMMEDIATE transactions take the write lock up front, so
+# concurrent writers wait up to busy_timeout instead of failing on a lock
+# upgrade. Connections live for CONN_MAX_AGE seconds instead of one request.
+STORE_SQLITE_TUNED = {
+    'CONN_MAX_AGE': 600,
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            'PRAGMA mmap_size=268435456;'
+            'PRAGMA cache_size=-65536;'
+            'PRAGMA busy_timeout=5000;'
+            'PRAGMA temp_store=MEMORY'
+        ),
+        'transaction_mode': 'IMMEDIATE',
+    },
+}
+if os.environ.get('STORE_SQLITE_PROFILE') == 'tuned':
+    for alias, database in DATABASES.items():
+        DATABASES[alias] = {**database, **copy.deepcopy(STORE_SQLITE_TUNED)}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -131,7 +191,37 @@ CACHES = {
         'BACKEND': 'django_redis.cache.RedisCache',
         'LOCATION': 'redis://127.0.0.1:6379/1',
         'OPTIONS': {
-            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            # DefaultClient that also counts hits and misses for /api/metrics
+            'CLIENT_CLASS': 'store.metrics.MeteredRedisClient',
         }
     }
 }
+
+# Seconds a list cache keeps being served after it expires or is invalidated,
+# while a single worker rebuilds it
+STORE_CACHE_STALE_GRACE = 60
+# Upper bound on how long a rebuild may hold its lock
+STORE_CACHE_LOCK_TIMEOUT = 10
+# Cache list responses as rendered JSON bodies instead of serializer data,
+# optionally compressed, one body per content encoding
+STORE_CACHE_RENDERED = False
+STORE_CACHE_COMPRESS = False
+# Change feed: writes of the last STORE_CHANGES_SETTLE seconds wait for the
+# next call, as they may still be committing; deletes are remembered for
+# STORE_TOMBSTONE_RETENTION_DAYS (see the prune_tombstones command)
+STORE_CHANGES_SETTLE = 1
+STORE_TOMBSTONE_RETENTION_DAYS = 30
+# Responses smaller than this many bytes are sent uncompressed
+STORE_COMPRESS_MIN_SIZE = 1024
+# Rebuild the hot list caches in a background thread after each write,
+# instead of leaving it to the next request; the warm_cache command does the
+# same on demand. STORE_CACHE_WARM_TOP is how many of the most requested
+# filter combinations are rebuilt besides the full and per-category lists.
+STORE_CACHE_REFRESH_ON_WRITE = False
+STORE_CACHE_WARM_TOP = 20
+# Serve reads on the product and category routes with native async views
+# (store.async_views); only useful when running under ASGI
+STORE_ASYNC_READS = False
+# Report the database, cache and render time of each request in a
+# Server-Timing response header
+STORE_SERVER_TIMING = False
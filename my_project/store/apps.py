@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 
 
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        from . import changes
+        from .cache import invalidated
+        from .metrics import install_query_recorder
+        from .models import Category, Product
+        from .stats import product_deleted, product_saved, product_saving
+        from .warming import refresh_on_write
+
+        connection_created.connect(install_query_recorder)
+        invalidated.connect(refresh_on_write)
+        pre_save.connect(product_saving, sender=Product)
+        post_save.connect(product_saved, sender=Product)
+        post_delete.connect(product_deleted, sender=Product)
+        post_delete.connect(changes.product_deleted, sender=Product)
+        pre_delete.connect(changes.category_deleting, sender=Category)
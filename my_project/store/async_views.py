@@ -0,0 +1,186 @@
+"""Native async versions of the read endpoints, for ASGI deployments.
+
+GET requests for JSON on the hot paths (full and filtered lists, detail by
+id) are served with the async ORM and async cache calls, so a worker is not
+tied up while it waits on Redis or the database. Everything else (writes,
+pagination, sparse fieldsets, the browsable API, MessagePack) is handed to
+the sync views in ``views``. Responses are the same as the sync views'.
+Enabled by ``STORE_ASYNC_READS``.
+"""
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from . import views
+from .cache import (
+    BODY_SUFFIXES,
+    CATEGORIES_KEY,
+    LIST_TIMEOUT,
+    PRODUCTS_KEY,
+    aget_or_load,
+    aversioned_key,
+    category_key,
+    filling,
+    get_or_rebuild_stale,
+    product_key,
+)
+from .conditional import (
+    alist_validators,
+    category_validators,
+    not_modified,
+    product_validators,
+    set_validators,
+)
+from .filters import afilter_products, filter_key, product_filters
+from .lists import render_body
+from .models import Category, Product
+from .pagination import is_paginated
+from .renderers import MSGPACK, ORJSONRenderer
+from .serializers import category_rows, product_rows
+from .warming import arecord_filter
+
+JSON = "application/json"
+
+
+def json_response(data=None, message=None, status_code=status.HTTP_200_OK):
+    body = ORJSONRenderer().render({"data": data, "message": message})
+    return HttpResponse(body, content_type=JSON, status=status_code)
+
+
+def is_async_read(request):
+    # Browsers asking for HTML get DRF's browsable API from the sync views,
+    # and MessagePack clients DRF's content negotiation
+    accept = request.headers.get("Accept", "")
+    return request.method == "GET" and "text/html" not in accept and MSGPACK not in accept
+
+
+def is_selection(request):
+    return "fields" in request.GET or "expand" in request.GET
+
+
+async def cached_list(request, key, namespace, build, single_flight=False):
+    """Async counterpart of ``views.cached_response``; ``build`` is async."""
+    rendered = getattr(settings, "STORE_CACHE_RENDERED", False)
+    encoding = views.body_encoding(request) if rendered else None
+    etag, modified = await alist_validators(JSON, key, namespace, encoding or "")
+    response = not_modified(request, etag, modified)
+    if response is None:
+        body_key = key + BODY_SUFFIXES[encoding] if rendered else key
+
+        async def load():
+            data = await build()
+            return render_body(data, encoding) if rendered else data
+
+        value, stale = await cache.aget(body_key), False
+        if value is None and single_flight:
+            # The lock wait blocks, so the rare rebuild runs in a thread
+            value, stale = await sync_to_async(get_or_rebuild_stale)(
+                body_key, async_to_sync(load), namespace=namespace
+            )
+        elif value is None:
+            with filling():
+                value = await load()
+            await cache.aset(key=body_key, value=value, timeout=LIST_TIMEOUT)
+        if rendered:
+            response = views.body_response(request, value, encoding)
+        else:
+            response = json_response(data=value, message="Success")
+        if stale:
+            return views.stale_response(response)
+    return set_validators(response, etag, modified)
+
+
+async def cached_detail(request, key, load, validators, not_found_message):
+    data = await aget_or_load(key, load)
+    if data is None:
+        return json_response(message=not_found_message, status_code=status.HTTP_404_NOT_FOUND)
+    etag, modified = validators(JSON, data)
+    response = not_modified(request, etag, modified) or json_response(data=data, message="Success")
+    return set_validators(response, etag, modified)
+
+
+async def first_row(rows_serializer, queryset):
+    row = await rows_serializer.values(queryset).afirst()
+    return None if row is None else rows_serializer.to_representation(row)
+
+
+@csrf_exempt
+async def categories_view(request):
+    if not is_async_read(request) or is_paginated(request.GET):
+        return await sync_to_async(views.categories_view)(request)
+    return await cached_list(
+        request,
+        CATEGORIES_KEY,
+        CATEGORIES_KEY,
+        lambda: category_rows.aserialize(Category.objects.all()),
+        single_flight=True,
+    )
+
+
+@csrf_exempt
+async def category_by_id_view(request, *args, **kwargs):
+    if not is_async_read(request):
+        return await sync_to_async(views.category_by_id_view)(request, *args, **kwargs)
+    id = kwargs.get("id")
+    return await cached_detail(
+        request,
+        category_key(id),
+        lambda: first_row(category_rows, Category.objects.filter(id=id)),
+        category_validators,
+        f"Category with id {id} not found",
+    )
+
+
+@csrf_exempt
+async def products_view(request, *args, **kwargs):
+    if (
+        not is_async_read(request)
+        or is_paginated(request.GET)
+        or is_selection(request)
+        or "ids" in request.GET
+    ):
+        return await sync_to_async(views.products_view)(request, *args, **kwargs)
+    try:
+        filters = product_filters(request.GET)
+    except ValueError:
+        return json_response(
+            message="Invalid price filter values",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        if not filters:
+            return await cached_list(
+                request,
+                PRODUCTS_KEY,
+                PRODUCTS_KEY,
+                lambda: product_rows.aserialize(Product.objects.all()),
+                single_flight=True,
+            )
+
+        async def build():
+            await arecord_filter(filters)
+            return await product_rows.aserialize(await afilter_products(filters))
+
+        key = await aversioned_key(PRODUCTS_KEY, "filter", filter_key(filters))
+        return await cached_list(request, key, PRODUCTS_KEY, build)
+    except Category.DoesNotExist:
+        return json_response(
+            message=f"Category with name '{request.GET['category_name']}' not found",
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+
+
+@csrf_exempt
+async def product_by_id_view(request, *args, **kwargs):
+    if not is_async_read(request) or is_selection(request):
+        return await sync_to_async(views.product_by_id_view)(request, *args, **kwargs)
+    id = kwargs.get("id")
+    return await cached_detail(
+        request,
+        product_key(id),
+        lambda: first_row(product_rows, Product.objects.filter(id=id)),
+        product_validators,
+        f"Product with id {id} not found",
+    )
@@ -0,0 +1,276 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import Signal
+
+PRODUCTS_KEY = "store:products"
+CATEGORIES_KEY = "store:categories"
+LIST_TIMEOUT = 5 * 60
+DETAIL_TIMEOUT = 5 * 60
+# Negative entries are short-lived: they only need to absorb bursts of
+# lookups for ids that do not exist.
+NOT_FOUND_TIMEOUT = 60
+NOT_FOUND = "store:not-found"
+# Sent with the namespace after its caches are invalidated by a write
+invalidated = Signal()
+# Suffixes of the pre-rendered response bodies cached next to a list's data,
+# by content encoding
+BODY_SUFFIXES = {None: ":json", "gzip": ":json.gz", "br": ":json.br"}
+
+_filling = ContextVar("store_cache_filling", default=False)
+
+
+def _seed():
+    # Seed from the clock so a lost counter never revives keys built from
+    # an older generation.
+    return time.time_ns() // 1000
+
+
+def generation(namespace):
+    """Return the current generation of a cache namespace.
+
+    Derived keys embed the generation, so bumping it orphans all of them at
+    once instead of deleting them one by one.
+    """
+    key = f"{namespace}:gen"
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, _seed(), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def bump_generation(namespace):
+    key = f"{namespace}:gen"
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _seed(), timeout=None)
+    cache.set(key=f"{namespace}:modified", value=time.time(), timeout=None)
+
+
+def last_modified(namespace, load=None):
+    """Return the time of the last write to a namespace, as a timestamp.
+
+    Unlike ``max(update_at)`` this also moves on deletes. When nothing has
+    been recorded yet, ``load`` provides the initial value (the current time
+    by default).
+    """
+    key = f"{namespace}:modified"
+    value = cache.get(key)
+    if value is None:
+        value = (load() if load else None) or time.time()
+        cache.add(key, value, timeout=None)
+    return value
+
+
+async def aversion(namespace):
+    """Return ``(generation, last write time)`` of a namespace in one round trip.
+
+    Either is ``None`` when not recorded yet; the sync helpers initialize them.
+    """
+    keys = [f"{namespace}:gen", f"{namespace}:modified"]
+    values = await cache.aget_many(keys)
+    return tuple(values.get(key) for key in keys)
+
+
+@contextmanager
+def filling():
+    """Mark the database reads made inside as loading a value to cache.
+
+    Replicas may lag the primary, and rows read from them right after a
+    write would be cached under the new generation; ``store.replicas``
+    sends these reads to the primary then.
+    """
+    token = _filling.set(True)
+    try:
+        yield
+    finally:
+        _filling.reset(token)
+
+
+def is_filling():
+    return _filling.get()
+
+
+def versioned_key(namespace, *parts):
+    return ":".join([namespace, str(generation(namespace)), *map(str, parts)])
+
+
+async def aversioned_key(namespace, *parts):
+    version, _ = await aversion(namespace)
+    if version is None:
+        return await sync_to_async(versioned_key)(namespace, *parts)
+    return ":".join([namespace, str(version), *map(str, parts)])
+
+
+def product_key(id):
+    return f"store:product:{id}"
+
+
+def category_key(id):
+    return f"store:category:{id}"
+
+
+def get_or_load(key, load):
+    """Read-through lookup of a single object.
+
+    ``load`` returns the value to cache, or ``None`` when the object does not
+    exist. Misses are cached as well, so repeated lookups of a missing id
+    never reach the database. Returns ``None`` for missing objects.
+    """
+    value = cache.get(key)
+    if value is None:
+        with filling():
+            value = load()
+        if value is None:
+            cache.set(key=key, value=NOT_FOUND, timeout=NOT_FOUND_TIMEOUT)
+            return None
+        cache.set(key=key, value=value, timeout=DETAIL_TIMEOUT)
+    return None if value == NOT_FOUND else value
+
+
+def get_many_or_load(ids, key, load):
+    """Batch version of ``get_or_load`` for the objects with ``ids``.
+
+    The cached objects are read with one ``get_many`` of ``key(id)``, the
+    others with one call of ``load(missing_ids)``, which returns a dict of
+    those that exist. Loaded objects and misses are cached with one
+    ``set_many`` each. Returns a dict of the existing objects by id.
+    """
+    keys = {id: key(id) for id in ids}
+    cached = cache.get_many(list(keys.values()))
+    values = {id: cached[keys[id]] for id in ids if keys[id] in cached}
+    missing = [id for id in ids if id not in values]
+    if missing:
+        with filling():
+            loaded = load(missing)
+        if loaded:
+            cache.set_many({keys[id]: value for id, value in loaded.items()}, timeout=DETAIL_TIMEOUT)
+        if len(loaded) < len(missing):
+            cache.set_many(
+                {keys[id]: NOT_FOUND for id in missing if id not in loaded},
+                timeout=NOT_FOUND_TIMEOUT,
+            )
+        values.update(loaded)
+    return {id: value for id, value in values.items() if value != NOT_FOUND}
+
+
+async def aget_or_load(key, load):
+    """Async version of ``get_or_load``; ``load`` is a coroutine function."""
+    value = await cache.aget(key)
+    if value is None:
+        with filling():
+            value = await load()
+        if value is None:
+            await cache.aset(key=key, value=NOT_FOUND, timeout=NOT_FOUND_TIMEOUT)
+            return None
+        await cache.aset(key=key, value=value, timeout=DETAIL_TIMEOUT)
+    return None if value == NOT_FOUND else value
+
+
+def get_or_rebuild(key, rebuild, timeout=LIST_TIMEOUT, namespace=None):
+    """Single-flight read of a hot list cache.
+
+    On a miss only the worker holding ``<key>:lock`` runs ``rebuild``. The
+    others serve ``<key>:stale``, the last value written, which outlives the
+    main key by ``STORE_CACHE_STALE_GRACE`` seconds and survives invalidation.
+    ``namespace`` is the generation guarding ``key``, the key itself by default.
+    """
+    return get_or_rebuild_stale(key, rebuild, timeout, namespace)[0]
+
+
+def get_or_rebuild_stale(key, rebuild, timeout=LIST_TIMEOUT, namespace=None):
+    """``get_or_rebuild`` returning ``(value, stale)``.
+
+    ``stale`` is true when the value is the stale copy, which may predate the
+    current generation.
+    """
+    namespace = namespace or key
+    value = cache.get(key)
+    if value is not None:
+        return value, False
+    grace = getattr(settings, "STORE_CACHE_STALE_GRACE", 60)
+    lock_timeout = getattr(settings, "STORE_CACHE_LOCK_TIMEOUT", 10)
+    lock_key, stale_key = f"{key}:lock", f"{key}:stale"
+    if not cache.add(lock_key, 1, timeout=lock_timeout):
+        value = cache.get(stale_key)
+        if value is not None:
+            return value, True
+        # Nothing to serve yet: wait for the rebuild in progress, and take
+        # over if its lock is released or expires without a value.
+        deadline = time.monotonic() + lock_timeout
+        while True:
+            time.sleep(0.05)
+            value = cache.get(key)
+            if value is not None:
+                return value, False
+            if cache.add(lock_key, 1, timeout=lock_timeout):
+                break
+            if time.monotonic() > deadline:
+                with filling():
+                    return rebuild(), False
+    try:
+        version = generation(namespace)
+        with filling():
+            value = rebuild()
+        cache.set(key=stale_key, value=value, timeout=timeout + grace)
+        # A write during the rebuild bumped the generation; the value may
+        # predate it, so keep it only as the stale copy.
+        if generation(namespace) == version:
+            cache.set(key=key, value=value, timeout=timeout)
+    finally:
+        cache.delete(lock_key)
+    return value, False
+
+
+def _invalidate(namespace):
+    cache.delete_many([namespace] + [namespace + suffix for suffix in BODY_SUFFIXES.values()])
+    bump_generation(namespace)
+    invalidated.send(sender=None, namespace=namespace)
+
+
+def patch_list(namespace, item):
+    """Invalidate a namespace after a write to ``item``, keeping its full list.
+
+    The cached full list gets ``item`` in place of the entry with the same id,
+    so the next reader does not rebuild it. Keys derived from the namespace
+    are orphaned as usual. When a rebuild holds the list's lock, or the list
+    is not cached in that form, this is a plain invalidation. So is a write by
+    another worker in the meantime, which ``items`` may predate: the list is
+    only written back while the generation is one bump, this one's, past the
+    one it was read at.
+    """
+    lock_key = f"{namespace}:lock"
+    lock_timeout = getattr(settings, "STORE_CACHE_LOCK_TIMEOUT", 10)
+    if not cache.add(lock_key, 1, timeout=lock_timeout):
+        _invalidate(namespace)
+        return
+    try:
+        version = generation(namespace)
+        items = cache.get(namespace)
+        _invalidate(namespace)
+        index = next((i for i, old in enumerate(items or ()) if old["id"] == item["id"]), None)
+        if index is not None and generation(namespace) == version + 1:
+            items[index] = item
+            grace = getattr(settings, "STORE_CACHE_STALE_GRACE", 60)
+            cache.set(key=namespace, value=items, timeout=LIST_TIMEOUT)
+            cache.set(key=f"{namespace}:stale", value=items, timeout=LIST_TIMEOUT + grace)
+            if generation(namespace) != version + 1:
+                # Another write invalidated the namespace while this one was set
+                cache.delete_many([namespace, f"{namespace}:stale"])
+    finally:
+        cache.delete(lock_key)
+
+
+def invalidate_products():
+    _invalidate(PRODUCTS_KEY)
+
+
+def invalidate_categories():
+    _invalidate(CATEGORIES_KEY)
+
@@ -0,0 +1,155 @@
+"""Change feed: the products written or deleted since a client's watermark.
+
+``product_changes`` pages through products by ``(update_at, id)`` and
+through tombstones by ``(deleted_at, product_id)``, each from where the
+client's token left off, so the payload grows with the changes rather than
+the catalog. Writes of the last ``STORE_CHANGES_SETTLE`` seconds are held
+back: ``update_at`` is set before the transaction commits, so rows can
+become visible out of timestamp order.
+
+Tombstones are recorded by the ``post_delete`` of single products, by the
+``pre_delete`` of categories for the products they cascade to, and once per
+batch by queryset deletes, whose per-row signals are skipped.
+"""
+import base64
+import binascii
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import PRODUCTS_KEY, last_modified
+from .models import Category, Product, ProductTombstone
+from .pagination import seek_after
+from .serializers import product_rows
+
+DEFAULT_CHANGES_LIMIT = 500
+MAX_CHANGES_LIMIT = 5000
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class ExpiredToken(Exception):
+    """The tombstones a token still needs may have been pruned."""
+
+
+# A position is ``(moment, id)``: the feed resumes after that item, or after
+# every item at ``moment`` when ``id`` is None.
+
+
+def encode_token(changed, deleted):
+    payload = json.dumps(
+        {"c": [changed[0].isoformat(), changed[1]], "d": [deleted[0].isoformat(), deleted[1]]}
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_token(token):
+    """Return the ``(changed, deleted)`` positions of a token."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        positions = []
+        for name in ("c", "d"):
+            moment, id = payload[name]
+            moment = parse_datetime(moment)
+            if moment is None or moment.tzinfo is None or not (id is None or type(id) is int):
+                raise ValueError
+            positions.append((moment, id))
+        return tuple(positions)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError) as e:
+        raise InvalidToken("Invalid since token") from e
+
+
+def _page(queryset, fields, position, until, limit):
+    """Return up to ``limit`` rows after ``position``, the next position and
+    whether rows up to ``until`` remain."""
+    queryset = queryset.filter(**{f"{fields[0]}__lte": until}).order_by(*fields)
+    if position is not None:
+        moment, id = position
+        queryset = queryset.filter(
+            Q(**{f"{fields[0]}__gt": moment}) if id is None else seek_after(fields, position)
+        )
+    rows = list(queryset[: limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1][fields[0]], rows[-1][fields[1]]), True
+    return rows, (until, None), False
+
+
+def product_changes(token=None, limit=DEFAULT_CHANGES_LIMIT):
+    """Return the page of the feed after ``token``, or from the start.
+
+    A client without a token gets every product, but no deletes. Raises
+    ``InvalidToken`` or ``ExpiredToken``.
+    """
+    now = timezone.now()
+    until = now - timedelta(seconds=getattr(settings, "STORE_CHANGES_SETTLE", 1))
+    if token:
+        changed, deleted = decode_token(token)
+        retention = timedelta(days=getattr(settings, "STORE_TOMBSTONE_RETENTION_DAYS", 30))
+        if deleted[0] < now - retention:
+            raise ExpiredToken
+        # Nothing was written after either position: skip the queries
+        if min(changed[0], deleted[0]).timestamp() >= last_modified(PRODUCTS_KEY):
+            return {"changed": [], "deleted": [], "next_since": token, "has_more": False}
+    else:
+        changed, deleted = None, (until, None)
+
+    rows, changed, more_changed = _page(
+        product_rows.values(Product.objects.all(), "update_at", "id"),
+        ("update_at", "id"), changed, until, limit,
+    )
+    tombstones, deleted, more_deleted = _page(
+        ProductTombstone.objects.values("deleted_at", "product_id"),
+        ("deleted_at", "product_id"), deleted, until, limit,
+    )
+    return {
+        "changed": [product_rows.to_representation(row) for row in rows],
+        "deleted": [tombstone["product_id"] for tombstone in tombstones],
+        "next_since": encode_token(changed, deleted),
+        "has_more": more_changed or more_deleted,
+    }
+
+
+def record_deleted(ids):
+    """Record the deletion of the products with ``ids``, with one upsert."""
+    deleted_at = timezone.now()
+    ProductTombstone.objects.bulk_create(
+        [ProductTombstone(product_id=id, deleted_at=deleted_at) for id in ids],
+        update_conflicts=True,
+        unique_fields=["product_id"],
+        update_fields=["deleted_at"],
+    )
+
+
+def product_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Category) or getattr(origin, "model", None) is Category:
+        # Recorded with the rest of its category's products
+        return
+    if getattr(origin, "model", None) is Product:
+        # Recorded with the rest of the queryset's products
+        return
+    record_deleted([instance.pk])
+
+
+def category_deleting(sender, instance, **kwargs):
+    """``pre_delete`` receiver recording the products a category delete cascades to."""
+    record_deleted(instance.products.values_list("id", flat=True))
+
+
+def prune_tombstones():
+    """Delete the tombstones past ``STORE_TOMBSTONE_RETENTION_DAYS``; return how many.
+
+    Tokens from before then get ``ExpiredToken``.
+    """
+    days = getattr(settings, "STORE_TOMBSTONE_RETENTION_DAYS", 30)
+    count, _ = ProductTombstone.objects.filter(
+        deleted_at__lt=timezone.now() - timedelta(days=days)
+    ).delete()
+    return count
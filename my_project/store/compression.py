@@ -0,0 +1,98 @@
+"""Response compression.
+
+``CompressionMiddleware`` encodes response bodies of at least
+``STORE_COMPRESS_MIN_SIZE`` bytes in the best encoding the client accepts:
+brotli when the optional ``brotli`` package is installed, else gzip. Cached
+list bodies are stored already compressed (``STORE_CACHE_COMPRESS``) and
+pass through it untouched.
+"""
+import gzip
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from .conditional import encoded_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Supported encodings, preferred first
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+# Levels that keep compressing on the request path cheap
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def accepted_encoding(request):
+    """Return the preferred encoding the request accepts, or ``None``."""
+    accepted = set()
+    for item in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        name, _, params = item.partition(";")
+        q = params.strip().removeprefix("q=").strip() if params else "1"
+        try:
+            if float(q) > 0:
+                accepted.add(name.strip().lower())
+        except ValueError:
+            pass
+    if "*" in accepted:
+        return ENCODINGS[0]
+    return next((encoding for encoding in ENCODINGS if encoding in accepted), None)
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        if data := process(chunk):
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress large and streamed responses, like Django's ``GZipMiddleware``.
+
+    Unlike there, strong ETags stay strong, with the encoding appended
+    (see ``conditional.encoded_etag``), so they remain usable in ``If-Match``.
+    """
+
+    def process_response(self, request, response):
+        if response.has_header("Content-Encoding") or response.status_code in (204, 304):
+            return response
+        if response.streaming:
+            if response.is_async:
+                return response
+        elif len(response.content) < getattr(settings, "STORE_COMPRESS_MIN_SIZE", 1024):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = accepted_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content, encoding)
+            del response.headers["Content-Length"]
+        else:
+            body = compress(response.content, encoding)
+            if len(body) >= len(response.content):
+                return response
+            response.content = body
+            response.headers["Content-Length"] = str(len(body))
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = encoded_etag(etag, encoding)
+        response.headers["Content-Encoding"] = encoding
+        return response
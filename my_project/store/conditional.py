@@ -0,0 +1,112 @@
+import hashlib
+import json
+import re
+
+from asgiref.sync import sync_to_async
+from django.db.models import Max
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, parse_etags
+
+from .cache import PRODUCTS_KEY, aversion, generation, last_modified
+from .models import Product
+
+
+# Suffix of the ETags of compressed responses
+ENCODED_ETAG = re.compile(r'-(?:br|gzip)"$')
+
+
+def make_etag(*parts):
+    digest = hashlib.md5("|".join(map(str, parts)).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def encoded_etag(etag, encoding):
+    """Strong ETag of a response compressed with ``encoding``.
+
+    Its bodies differ byte for byte from the uncompressed ones, so the ETag
+    differs too, but the validators strip the suffix before comparing.
+    """
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _request_etags(header):
+    return [ENCODED_ETAG.sub('"', etag) for etag in parse_etags(header)]
+
+
+def _products_last_update():
+    value = Product.objects.aggregate(last=Max("update_at"))["last"]
+    return value.timestamp() if value else None
+
+
+_LAST_MODIFIED_LOADERS = {PRODUCTS_KEY: _products_last_update}
+
+
+def list_validators(media_type, key, namespace, variant=""):
+    """ETag and Last-Modified of a cached list.
+
+    Both come from the namespace's generation and last write time, so they
+    are known without building the list or querying the database.
+    """
+    etag = make_etag(key, generation(namespace), media_type, variant)
+    modified = last_modified(namespace, _LAST_MODIFIED_LOADERS.get(namespace))
+    return etag, modified
+
+
+async def alist_validators(media_type, key, namespace, variant=""):
+    version, modified = await aversion(namespace)
+    if version is None or modified is None:
+        return await sync_to_async(list_validators)(media_type, key, namespace, variant)
+    return make_etag(key, version, media_type, variant), modified
+
+
+def product_validators(media_type, data, variant=""):
+    etag = make_etag("product", data["id"], data["update_at"], media_type, variant)
+    return etag, parse_datetime(data["update_at"]).timestamp()
+
+
+def category_validators(media_type, data):
+    # Categories carry no timestamp, so the ETag hashes the content.
+    etag = make_etag("category", json.dumps(data, sort_keys=True), media_type)
+    return etag, None
+
+
+def not_modified(request, etag, modified):
+    """Return a 304 response when the request's validators match.
+
+    The ETags of compressed responses match those of the uncompressed ones.
+    """
+    modified = int(modified) if modified else None
+    for name in ("HTTP_IF_NONE_MATCH", "HTTP_IF_MATCH"):
+        if name in request.META:
+            request.META[name] = ", ".join(_request_etags(request.META[name]))
+    return get_conditional_response(request, etag=etag, last_modified=modified)
+
+
+def if_match(request, etag):
+    """Whether the request's If-Match header, if any, allows writing ``etag``.
+
+    Weak ETags never match, as RFC 9110 requires for If-Match.
+    """
+    header = request.headers.get("If-Match")
+    if header is None:
+        return True
+    etags = _request_etags(header)
+    return etags == ["*"] or etag in etags
+
+
+def set_validators(response, etag, modified):
+    if response.status_code in (200, 304):
+        response["ETag"] = etag
+        if modified:
+            response["Last-Modified"] = http_date(int(modified))
+    return response
+
+
+def conditional_response(request, etag, modified, respond):
+    """Return a 304 when the request's validators match, else ``respond()``.
+
+    Either way the response carries the ETag and Last-Modified headers.
+    """
+    response = not_modified(request, etag, modified) or respond()
+    return set_validators(response, etag, modified)
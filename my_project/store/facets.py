@@ -0,0 +1,89 @@
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from .filters import find_category_id
+from .models import Product
+
+# Upper edges of the price histogram buckets; the last bucket is open-ended
+PRICE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000)
+MAX_PRICE_BUCKETS = 50
+
+
+def price_buckets(query_params):
+    """Return the bucket edges of ``?price_buckets=10,25,50``, or the defaults.
+
+    Raises ``ValueError`` unless they are strictly increasing numbers.
+    """
+    value = query_params.get("price_buckets")
+    if not value:
+        return tuple(Decimal(edge) for edge in PRICE_BUCKETS)
+    try:
+        edges = tuple(Decimal(edge) for edge in value.split(","))
+    except InvalidOperation as e:
+        raise ValueError("Invalid price buckets") from e
+    if not 0 < len(edges) <= MAX_PRICE_BUCKETS or any(
+        not edge.is_finite() or edge >= next_edge
+        for edge, next_edge in zip(edges, edges[1:] + (Decimal("Infinity"),))
+    ):
+        raise ValueError("Invalid price buckets")
+    return edges
+
+
+def product_facets(filters, edges):
+    """Count the products matching ``filters`` by category and by price bucket.
+
+    Each facet leaves out its own filter, so it tells how many results each
+    choice would give: category counts apply the price range but no
+    category, and the histogram applies the category but no price range.
+    ``count`` applies both. One grouped query answers all three, read from
+    the (category, price) index. Raises ``Category.DoesNotExist`` when the
+    category name matches nothing.
+    """
+    category_id = (
+        find_category_id(filters["category_name"]) if "category_name" in filters else None
+    )
+    price_range = Q()
+    if "price_min" in filters:
+        price_range &= Q(price__gte=filters["price_min"])
+    if "price_max" in filters:
+        price_range &= Q(price__lte=filters["price_max"])
+    rows = (
+        Product.objects.annotate(
+            bucket=Case(
+                *(When(price__lt=edge, then=Value(i)) for i, edge in enumerate(edges)),
+                default=Value(len(edges)),
+                output_field=IntegerField(),
+            ),
+            in_range=Case(When(price_range, then=Value(True)), default=Value(False))
+            if price_range
+            else Value(True),
+        )
+        .values("category_id", "category__name", "bucket", "in_range")
+        .annotate(count=Count("pk"))
+        .order_by()
+    )
+
+    total, categories, names, histogram = 0, Counter(), {}, Counter()
+    for row in rows:
+        selected = category_id is None or row["category_id"] == category_id
+        if row["in_range"]:
+            categories[row["category_id"]] += row["count"]
+            names[row["category_id"]] = row["category__name"]
+            if selected:
+                total += row["count"]
+        if selected:
+            histogram[row["bucket"]] += row["count"]
+
+    bounds = [None, *(f"{edge:.2f}" for edge in edges), None]
+    return {
+        "count": total,
+        "categories": [
+            {"id": id, "name": names[id], "count": categories[id]} for id in sorted(categories)
+        ],
+        "price_histogram": [
+            {"min": bounds[i], "max": bounds[i + 1], "count": histogram[i]}
+            for i in range(len(edges) + 1)
+        ],
+    }
@@ -0,0 +1,93 @@
+import math
+from urllib.parse import urlencode
+
+from django.db.models.functions import Lower
+
+from .models import Category, Product
+
+
+def _price(value):
+    value = float(value)
+    # nan, inf and overflows like 1e400 pass float() but not the price lookup
+    if not math.isfinite(value):
+        raise ValueError(value)
+    return value
+
+
+def product_filters(query_params):
+    """Normalize the product filter params of a request.
+
+    Equivalent requests (``price_min=20`` and ``price_min=20.0``, or
+    ``category_name=Cat1`` and ``category_name=cat1``) map to the same dict, so
+    they share one cache entry. Raises ``ValueError`` on invalid prices.
+    """
+    filters = {}
+    category_name = query_params.get("category_name")
+    price_min = query_params.get("price_min")
+    price_max = query_params.get("price_max")
+    if price_min:
+        filters["price_min"] = _price(price_min)
+    if price_max:
+        filters["price_max"] = _price(price_max)
+    if category_name:
+        # The lookup is icontains, which SQLite only folds for ASCII.
+        filters["category_name"] = (
+            category_name.lower() if category_name.isascii() else category_name
+        )
+    return filters
+
+
+def filter_key(filters):
+    return urlencode(sorted(filters.items()))
+
+
+def filter_products(filters):
+    """Return the products matching normalized ``filters``.
+
+    Raises ``Category.DoesNotExist`` when the category name matches nothing.
+    """
+    lookups = {}
+    if "price_min" in filters:
+        lookups["price__gte"] = filters["price_min"]
+    if "price_max" in filters:
+        lookups["price__lte"] = filters["price_max"]
+    if "category_name" in filters:
+        lookups["category_id"] = find_category_id(filters["category_name"])
+    return Product.objects.filter(**lookups)
+
+
+async def afilter_products(filters):
+    """Async version of ``filter_products``."""
+    lookups = {}
+    if "price_min" in filters:
+        lookups["price__gte"] = filters["price_min"]
+    if "price_max" in filters:
+        lookups["price__lte"] = filters["price_max"]
+    if "category_name" in filters:
+        lookups["category_id"] = await afind_category_id(filters["category_name"])
+    return Product.objects.filter(**lookups)
+
+
+def categories_named(name):
+    """Categories whose name equals ``name`` ignoring case, via LOWER("name")."""
+    return Category.objects.alias(lower_name=Lower("name")).filter(lower_name=name.lower())
+
+
+def find_category_id(name):
+    """Resolve a category name to its id, ignoring case.
+
+    Exact names are matched through the LOWER("name") index; anything else
+    falls back to the substring match the API has always done.
+    """
+    category_id = categories_named(name).values_list("id", flat=True).first()
+    if category_id is None:
+        category_id = Category.objects.get(name__icontains=name).id
+    return category_id
+
+
+async def afind_category_id(name):
+    """Async version of ``find_category_id``."""
+    category_id = await categories_named(name).values_list("id", flat=True).afirst()
+    if category_id is None:
+        category_id = (await Category.objects.aget(name__icontains=name)).id
+    return category_id
@@ -0,0 +1,49 @@
+from django.conf import settings
+
+from .cache import (
+    BODY_SUFFIXES,
+    CATEGORIES_KEY,
+    PRODUCTS_KEY,
+    get_or_rebuild,
+    invalidate_categories,
+    invalidate_products,
+)
+from .compression import ENCODINGS, compress
+from .models import Category, Product
+from .renderers import ORJSONRenderer
+from .serializers import category_rows, product_rows
+
+
+def product_list():
+    return product_rows.serialize(Product.objects.all())
+
+
+def category_list():
+    return category_rows.serialize(Category.objects.all())
+
+
+def render_body(data, encoding=None):
+    body = ORJSONRenderer().render({"data": data, "message": "Success"})
+    return compress(body, encoding) if encoding else body
+
+
+def rebuild_list(namespace, build, key=None):
+    """Rebuild a list cache in the form the views read it, unless it is cached.
+
+    ``key`` is the list's cache key, by default the namespace's full list.
+    Compressed bodies are rebuilt in the preferred encoding only.
+    """
+    key = key or namespace
+    if getattr(settings, "STORE_CACHE_RENDERED", False):
+        encoding = ENCODINGS[0] if getattr(settings, "STORE_CACHE_COMPRESS", False) else None
+        key = key + BODY_SUFFIXES[encoding]
+        return get_or_rebuild(key, lambda: render_body(build(), encoding), namespace=namespace)
+    return get_or_rebuild(key, build, namespace=namespace)
+
+
+def refresh_lists():
+    """Invalidate every store:* list cache and rebuild the full lists."""
+    invalidate_products()
+    invalidate_categories()
+    rebuild_list(PRODUCTS_KEY, product_list)
+    rebuild_list(CATEGORIES_KEY, category_list)
@@ -0,0 +1,441 @@
+import copy
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.core.cache import cache
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from store import metrics
+from store.models import Category, Product
+from store.stats import rebuild_category_stats
+
+ADJECTIVES = ["red", "blue", "green", "small", "large", "classic", "smart", "eco"]
+NOUNS = ["widget", "gadget", "lamp", "chair", "bottle", "speaker", "backpack", "watch"]
+PRICE_BANDS = [(None, 50), (50, 200), (200, 500), (500, None), (100, 150)]
+
+
+# Local stand-in for Redis; its hits and misses go to the request metrics
+BENCH_CACHES = {
+    "default": {
+        "BACKEND": "store.metrics.MeteredLocMemCache",
+        "LOCATION": "bench-store",
+    }
+}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def git_commit():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every store API endpoint against a throwaway seeded database "
+        "and a local in-memory cache, and report throughput, latency percentiles, "
+        "queries per request and cache hit ratio as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categories", type=int, default=20)
+        parser.add_argument("--products", type=int, default=10000)
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Requests per scenario"
+        )
+        parser.add_argument(
+            "--write-ratios",
+            default="0.05,0.2",
+            help="Comma-separated write shares of the mixed read/write scenarios",
+        )
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", help="Write the JSON report to this file")
+        parser.add_argument("--compare", help="Previous JSON report to compare against")
+        parser.add_argument(
+            "--current-database",
+            action="store_true",
+            help="Seed the configured database instead of a throwaway test database",
+        )
+        parser.add_argument(
+            "--database-file",
+            help="Create the throwaway database in this SQLite file instead of in "
+            "memory; WAL needs a file",
+        )
+        parser.add_argument(
+            "--sqlite-profile",
+            choices=["default", "tuned"],
+            default="default",
+            help="Connection settings of the benchmark database; 'tuned' applies "
+            "STORE_SQLITE_TUNED",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=1,
+            help="Concurrent clients sharing the mixed read/write scenarios",
+        )
+
+    def handle(self, *args, **options):
+        if min(
+            options["categories"], options["products"], options["requests"], options["threads"]
+        ) < 1:
+            raise CommandError(
+                "--categories, --products, --requests and --threads must be positive"
+            )
+        if options["database_file"] and options["current_database"]:
+            raise CommandError("--database-file and --current-database are exclusive")
+        try:
+            write_ratios = [float(r) for r in options["write_ratios"].split(",") if r]
+        except ValueError:
+            raise CommandError("--write-ratios must be comma-separated numbers")
+        self.random = random.Random(options["seed"])
+        self.category_names = itertools.count()
+        self.requests = options["requests"]
+        self.threads = options["threads"]
+
+        # Every thread's connection is built from this same settings dict
+        saved_settings = copy.deepcopy(connection.settings_dict)
+        connection.close()
+        if options["sqlite_profile"] == "tuned":
+            connection.settings_dict.update(copy.deepcopy(settings.STORE_SQLITE_TUNED))
+        if options["database_file"]:
+            connection.settings_dict["TEST"]["NAME"] = os.path.abspath(
+                options["database_file"]
+            )
+        with override_settings(CACHES=BENCH_CACHES, ALLOWED_HOSTS=["testserver"]):
+            old_name = connection.settings_dict["NAME"]
+            if not options["current_database"]:
+                connection.creation.create_test_db(
+                    verbosity=0, autoclobber=True, serialize=False
+                )
+            try:
+                journal_mode = self.journal_mode()
+                self.seed(options["categories"], options["products"])
+                self.client = Client()
+                scenarios = self.run_scenarios(write_ratios)
+            finally:
+                cache.clear()
+                if not options["current_database"]:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+                connection.close()
+                connection.settings_dict.clear()
+                connection.settings_dict.update(saved_settings)
+
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "categories": options["categories"],
+                "products": options["products"],
+                "requests_per_scenario": self.requests,
+                "seed": options["seed"],
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "database_file": bool(options["database_file"]),
+                "sqlite_profile": options["sqlite_profile"],
+                "journal_mode": journal_mode,
+                "threads": self.threads,
+            },
+            "scenarios": scenarios,
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output + "\n")
+        else:
+            self.stdout.write(output)
+        if options["compare"]:
+            self.compare(options["compare"], scenarios)
+
+    def seed(self, categories, products):
+        Category.objects.bulk_create(
+            Category(name=f"category {i}", description=f"Category number {i}")
+            for i in range(categories)
+        )
+        self.category_ids = list(Category.objects.values_list("id", flat=True))
+        batch = []
+        for i in range(products):
+            name = f"{self.random.choice(ADJECTIVES)} {self.random.choice(NOUNS)} {i}"
+            batch.append(
+                Product(
+                    name=name,
+                    description=f"A {name} for benchmarks",
+                    price=f"{self.random.uniform(1, 1000):.2f}",
+                    category_id=self.random.choice(self.category_ids),
+                )
+            )
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+        rebuild_category_stats()
+        self.product_ids = list(Product.objects.values_list("id", flat=True))
+
+    # Request builders: each returns (method, path, json body or None)
+
+    def product_id(self):
+        return self.random.choice(self.product_ids)
+
+    def category_id(self):
+        return self.random.choice(self.category_ids)
+
+    def filtered(self):
+        low, high = self.random.choice(PRICE_BANDS)
+        params = []
+        if low is not None:
+            params.append(f"price_min={low}")
+        if high is not None:
+            params.append(f"price_max={high}")
+        if self.random.random() < 0.5:
+            params.append(f"category_name=category {self.random.randrange(len(self.category_ids))}")
+        return "GET", "/api/products?" + "&".join(params), None
+
+    def product_body(self):
+        return {
+            "name": f"{self.random.choice(ADJECTIVES)} {self.random.choice(NOUNS)}",
+            "description": "benchmark write",
+            "price": f"{self.random.uniform(1, 1000):.2f}",
+            "category": self.category_id(),
+        }
+
+    def category_body(self):
+        # Names are unique, and must not match the name filters
+        return {"name": f"bench {next(self.category_names)}", "description": "benchmark write"}
+
+    def reads(self):
+        return {
+            "overview": lambda: ("GET", "/api/", None),
+            "categories.list": lambda: ("GET", "/api/categories", None),
+            "categories.page": lambda: ("GET", "/api/categories?limit=10", None),
+            "categories.detail": lambda: ("GET", f"/api/categories/{self.category_id()}", None),
+            "categories.stats": lambda: ("GET", "/api/categories/stats", None),
+            "products.list": lambda: ("GET", "/api/products", None),
+            "products.filtered": self.filtered,
+            "products.fields": lambda: (
+                "GET", "/api/products?fields=id,name,price&expand=category", None
+            ),
+            "products.page": lambda: ("GET", "/api/products?limit=50&ordering=price", None),
+            "products.detail": lambda: ("GET", f"/api/products/{self.product_id()}", None),
+            "products.batch": lambda: (
+                "GET",
+                "/api/products?ids=" + ",".join(str(self.product_id()) for _ in range(20)),
+                None,
+            ),
+            "products.facets": lambda: ("GET", self.filtered()[1].replace("?", "/facets?"), None),
+            "products.search": lambda: (
+                "GET",
+                f"/api/products/search?q={self.random.choice(NOUNS)[:4]}",
+                None,
+            ),
+            "products.changes": lambda: ("GET", "/api/products/changes?limit=100", None),
+            "metrics": lambda: ("GET", "/api/metrics", None),
+        }
+
+    def writes(self):
+        def update():
+            return "PUT", f"/api/products/{self.product_id()}", self.product_body()
+
+        def create_and_delete():
+            # Deletes keep the catalog size stable across the run
+            response = self.client.post("/api/products", self.product_body(), "application/json")
+            return "DELETE", f"/api/products/{response.json()['data']['id']}", None
+
+        def bulk_update():
+            body = [{**self.product_body(), "id": self.product_id()} for _ in range(50)]
+            return "PUT", "/api/products/bulk", body
+
+        def bulk_create_and_delete():
+            body = [self.product_body() for _ in range(50)]
+            response = self.client.post("/api/products/bulk", body, "application/json")
+            return "DELETE", "/api/products/bulk", ids(response)
+
+        def patch():
+            body = {"price": self.product_body()["price"]}
+            return "PATCH", f"/api/products/{self.product_id()}", body
+
+        def create_and_delete_category():
+            body = self.category_body()
+            response = self.client.post("/api/categories", body, "application/json")
+            return "DELETE", f"/api/categories/{response.json()['data']['id']}", None
+
+        def bulk_create_and_delete_categories():
+            body = [self.category_body() for _ in range(20)]
+            response = self.client.post("/api/categories/bulk", body, "application/json")
+            return "DELETE", "/api/categories/bulk", ids(response)
+
+        def ids(response):
+            return [item["id"] for item in response.json()["data"]["results"]]
+
+        return {
+            "products.create": lambda: ("POST", "/api/products", self.product_body()),
+            "products.update": update,
+            "products.patch": patch,
+            "products.delete": create_and_delete,
+            "products.bulk_create": lambda: (
+                "POST",
+                "/api/products/bulk",
+                [self.product_body() for _ in range(50)],
+            ),
+            "products.bulk_update": bulk_update,
+            "products.bulk_delete": bulk_create_and_delete,
+            "categories.create": lambda: ("POST", "/api/categories", self.category_body()),
+            "categories.delete": create_and_delete_category,
+            "categories.bulk_create": lambda: (
+                "POST",
+                "/api/categories/bulk",
+                [self.category_body() for _ in range(20)],
+            ),
+            "categories.bulk_delete": bulk_create_and_delete_categories,
+            "categories.update": lambda: (
+                "PUT",
+                f"/api/categories/{self.category_id()}",
+                {"name": f"category renamed {self.random.random()}"},
+            ),
+        }
+
+    def run_scenarios(self, write_ratios):
+        results = {}
+        reads = self.reads()
+        for name, build in reads.items():
+            results[f"{name}.cold"] = self.measure(build, cold=True)
+            results[f"{name}.warm"] = self.measure(build, warm=True)
+        # Export streams the whole catalog, so it runs fewer times
+        results["products.export"] = self.measure(
+            lambda: ("GET", "/api/products/export", None), count=max(1, self.requests // 20)
+        )
+        writes = self.writes()
+        # Renaming categories breaks the name filters of later scenarios
+        rename = writes.pop("categories.update")
+        for name, build in writes.items():
+            results[name] = self.measure(build)
+        mixed_reads = [reads["products.list"], reads["products.detail"], self.filtered]
+        for ratio in write_ratios:
+
+            def mixed():
+                if self.random.random() < ratio:
+                    return "PUT", f"/api/products/{self.product_id()}", self.product_body()
+                return self.random.choice(mixed_reads)()
+
+            results[f"mixed.write_{ratio:g}"] = self.measure(
+                mixed, warm=True, threads=self.threads
+            )
+        results["categories.update"] = self.measure(rename)
+        return results
+
+    def journal_mode(self):
+        if connection.vendor != "sqlite":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            return cursor.fetchone()[0]
+
+    def request(self, method, path, body, client=None):
+        response = (client or self.client).generic(
+            method, path, json.dumps(body) if body is not None else "", "application/json"
+        )
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    def measure(self, build, cold=False, warm=False, count=None, threads=1):
+        """Run ``count`` requests from ``build`` and summarize them.
+
+        ``cold`` clears the cache before every request; ``warm`` first sends
+        each distinct read once so the measured run replays cached requests.
+        With ``threads`` the requests are shared out to that many concurrent
+        clients, each on its own database connection.
+        """
+        requests = [build() for _ in range(count or self.requests)]
+        if warm:
+            for method, path in {(m, p) for m, p, body in requests if m == "GET"}:
+                self.request(method, path, None)
+        metrics.reset()
+        started = time.perf_counter()
+        if threads == 1:
+            results = [self.run(requests, cold, self.client)]
+        else:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                results = list(
+                    pool.map(self.run_thread, [requests[i::threads] for i in range(threads)])
+                )
+        elapsed = time.perf_counter() - started
+        latencies, queries, statuses = [], 0, Counter()
+        for thread_latencies, thread_queries, thread_statuses in results:
+            latencies += thread_latencies
+            queries += thread_queries
+            statuses += thread_statuses
+        stats = Counter()
+        for (_, operation), count in metrics.CACHE_OPERATIONS.values.items():
+            stats[operation] += count
+        lookups = stats["hit"] + stats["miss"]
+        return {
+            "requests": len(latencies),
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "latency_ms": {
+                "mean": round(statistics.fmean(latencies), 3),
+                "p50": round(percentile(latencies, 50), 3),
+                "p95": round(percentile(latencies, 95), 3),
+                "p99": round(percentile(latencies, 99), 3),
+            },
+            "queries_per_request": round(queries / len(latencies), 2),
+            "cache_hit_ratio": round(stats["hit"] / lookups, 3) if lookups else None,
+            "status_codes": dict(statuses),
+        }
+
+    def run(self, requests, cold, client):
+        latencies, queries, statuses = [], 0, Counter()
+        for request in requests:
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = self.request(*request, client=client)
+                latencies.append((time.perf_counter() - start) * 1000)
+            queries += len(captured)
+            statuses[str(response.status_code)] += 1
+        return latencies, queries, statuses
+
+    def run_thread(self, requests):
+        # Failed requests count as 500s instead of stopping the run
+        try:
+            return self.run(requests, False, Client(raise_request_exception=False))
+        finally:
+            connections.close_all()
+
+    def compare(self, path, scenarios):
+        with open(path) as file:
+            previous = json.load(file)["scenarios"]
+        self.stderr.write(f"{'scenario':32} {'p50 ms':>18} {'rps':>20}")
+        for name, result in scenarios.items():
+            if name not in previous:
+                continue
+            before = previous[name]
+            p50, old_p50 = result["latency_ms"]["p50"], before["latency_ms"]["p50"]
+            rps, old_rps = result["throughput_rps"], before["throughput_rps"]
+            self.stderr.write(
+                f"{name:32} {old_p50:8.3f} -> {p50:7.3f} {old_rps:9.1f} -> {rps:8.1f}"
+                f" ({(rps - old_rps) / old_rps * 100 if old_rps else 0:+.0f}%)"
+            )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.stats import rebuild_category_stats, verify_category_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-category product stats, or check them with --verify."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report the categories whose stats are out of date",
+        )
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            stale = verify_category_stats()
+            if stale:
+                raise CommandError(
+                    f"Stats out of date for {len(stale)} categories: "
+                    + ", ".join(map(str, stale))
+                )
+            self.stdout.write(self.style.SUCCESS("Category stats are up to date"))
+            return
+        count = rebuild_category_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the stats of {count} categories"))
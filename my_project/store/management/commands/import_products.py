@@ -0,0 +1,163 @@
+import csv
+import json
+import sys
+import time
+from decimal import Decimal
+from itertools import islice
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from store.cache import product_key
+from store.lists import refresh_lists
+from store.models import Category, Product
+from store.stats import rebuild_category_stats
+
+FIELDS = ("name", "description", "price")
+UPSERT_FIELDS = ["name", "description", "price", "category", "update_at"]
+# Only the first errors are printed, the rest are counted
+MAX_REPORTED_ERRORS = 20
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_csv(file):
+    for line, row in enumerate(csv.DictReader(file), start=2):
+        yield line, row
+
+
+def read_jsonl(file):
+    for line, text in enumerate(file, start=1):
+        if not text.strip():
+            continue
+        try:
+            # As Decimal, since floats fail the price's decimal places check
+            row = json.loads(text, parse_float=Decimal)
+        except ValueError as e:
+            row = RowError(f"invalid JSON: {e}")
+        yield line, row
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+
+
+class Command(BaseCommand):
+    help = (
+        "Import products from a CSV or JSON Lines file with name, description, "
+        "price, category (name) and optional id columns. Rows with an id "
+        "update the existing product."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file, or - for stdin")
+        parser.add_argument(
+            "--format", choices=READERS, help="Input format, guessed from the extension by default"
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per INSERT")
+        parser.add_argument(
+            "--transaction-size", type=int, default=20000, help="Rows per transaction"
+        )
+        parser.add_argument(
+            "--create-categories",
+            action="store_true",
+            help="Create missing categories instead of skipping their rows",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        input_format = options["format"] or path.rpartition(".")[2].lower()
+        if input_format not in READERS:
+            raise CommandError("Cannot guess the input format, use --format")
+        if options["batch_size"] < 1 or options["transaction_size"] < 1:
+            raise CommandError("--batch-size and --transaction-size must be positive")
+        self.create_categories = options["create_categories"]
+        self.categories = dict(Category.objects.values_list("name", "id"))
+        self.fields = {name: Product._meta.get_field(name) for name in FIELDS}
+        self.errors = 0
+
+        file = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            rows = READERS[input_format](file)
+            imported = self.import_rows(rows, options["batch_size"], options["transaction_size"])
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+        # Bulk inserts and upserts bypass the incremental stats updates
+        rebuild_category_stats()
+        refresh_lists()
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported {imported} products, skipped {self.errors} rows")
+        )
+
+    def import_rows(self, rows, batch_size, transaction_size):
+        imported = 0
+        start = time.monotonic()
+        while True:
+            chunk = list(islice(rows, transaction_size))
+            if not chunk:
+                return imported
+            with transaction.atomic():
+                products = [p for p in map(self.build_product, chunk) if p is not None]
+                for i in range(0, len(products), batch_size):
+                    self.write_batch(products[i : i + batch_size])
+            imported += len(products)
+            rate = imported / max(time.monotonic() - start, 1e-9)
+            self.stdout.write(f"{imported} rows imported ({rate:.0f} rows/sec)")
+
+    def write_batch(self, products):
+        inserts = [p for p in products if p.id is None]
+        upserts = [p for p in products if p.id is not None]
+        Product.objects.bulk_create(inserts)
+        if upserts:
+            Product.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=["id"],
+                update_fields=UPSERT_FIELDS,
+            )
+        # New and updated ids may hold stale or negative per-id entries
+        cache.delete_many([product_key(p.id) for p in products if p.id is not None])
+
+    def build_product(self, item):
+        line, row = item
+        try:
+            if isinstance(row, RowError):
+                raise row
+            if not isinstance(row, dict):
+                raise RowError("expected an object")
+            values = {
+                name: field.clean(None if row.get(name) == "" else row.get(name), None)
+                for name, field in self.fields.items()
+            }
+            id = row.get("id")
+            if id not in (None, ""):
+                try:
+                    values["id"] = int(id)
+                except (TypeError, ValueError):
+                    raise RowError(f"invalid id {id!r}")
+            values["category_id"] = self.category_id(row.get("category"))
+        except ValidationError as e:
+            return self.skip(line, "; ".join(e.messages))
+        except RowError as e:
+            return self.skip(line, str(e))
+        return Product(**values)
+
+    def category_id(self, name):
+        if not name:
+            raise RowError("category is required")
+        if name not in self.categories:
+            if not self.create_categories:
+                raise RowError(f"unknown category {name!r}")
+            self.categories[name] = Category.objects.create(name=name).id
+        return self.categories[name]
+
+    def skip(self, line, message):
+        self.errors += 1
+        if self.errors <= MAX_REPORTED_ERRORS:
+            self.stderr.write(f"line {line}: {message}")
+        return None
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store.changes import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the deleted-product records of the change feed that are older than "
+        "STORE_TOMBSTONE_RETENTION_DAYS."
+    )
+
+    def handle(self, *args, **options):
+        count = prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {count} tombstones"))
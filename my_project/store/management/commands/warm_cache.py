@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.cache import invalidate_categories, invalidate_products
+from store.warming import DEFAULT_WARM_TOP, warm_caches
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the product and category list caches, the product list of every "
+        "category and the most requested filter combinations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=getattr(settings, "STORE_CACHE_WARM_TOP", DEFAULT_WARM_TOP),
+            help="Number of recorded filter combinations to warm",
+        )
+        parser.add_argument(
+            "--invalidate",
+            action="store_true",
+            help="Drop the cached lists first, e.g. when a deploy changed their format",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options["invalidate"]:
+            invalidate_products()
+            invalidate_categories()
+        count = warm_caches(options["top"])
+        self.stdout.write(f"Warmed {count} lists in {time.monotonic() - started:.2f}s")
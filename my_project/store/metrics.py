@@ -0,0 +1,289 @@
+"""Per-request instrumentation and its Prometheus exposition.
+
+``MetricsMiddleware`` times every request and, through a context variable,
+collects the database queries and cache operations it triggers. The totals
+live in memory, so each worker process serves its own series at
+``/api/metrics``.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django_redis.client import DefaultClient
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_current = ContextVar("store_request_metrics", default=None)
+_lock = threading.Lock()
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name, self.help, self.labels = name, help, labels
+        self.values = defaultdict(float)
+
+    def inc(self, labels, amount=1):
+        self.values[labels] += amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labels, labels)} {value!r}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        # Per label set: bucket counts (non-cumulative), then the sum
+        self.values = {}
+
+    def observe(self, labels, value):
+        counts = self.values.setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[len(self.buckets)] += 1
+        counts[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, counts in sorted(self.values.items()):
+            total = 0
+            for bound, count in zip(bounds, counts):
+                total += count
+                yield f"{self.name}_bucket{_labels((*self.labels, 'le'), (*labels, bound))} {total}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {counts[-1]!r}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {total}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}" if pairs else ""
+
+
+REQUEST_DURATION = Histogram(
+    "store_request_duration_seconds", "Time spent handling a request.",
+    ("view", "method"), LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    "store_requests_total", "Requests handled.", ("view", "method", "status")
+)
+DB_QUERIES = Counter("store_db_queries_total", "Database queries run.", ("view",))
+DB_DURATION = Counter(
+    "store_db_query_seconds_total", "Time spent in database queries.", ("view",)
+)
+RENDER_DURATION = Counter(
+    "store_render_seconds_total", "Time spent rendering response bodies.", ("view",)
+)
+CACHE_OPERATIONS = Counter(
+    "store_cache_operations_total", "Cache lookups and writes by key namespace.",
+    ("namespace", "operation"),
+)
+RESPONSE_SIZE = Histogram(
+    "store_response_size_bytes", "Size of non-streaming response bodies.",
+    ("view",), SIZE_BUCKETS,
+)
+METRICS = (
+    REQUEST_DURATION, REQUESTS, DB_QUERIES, DB_DURATION, RENDER_DURATION,
+    CACHE_OPERATIONS, RESPONSE_SIZE,
+)
+
+
+def render():
+    """Return all metrics in the Prometheus text format."""
+    with _lock:
+        return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+def reset():
+    with _lock:
+        for metric in METRICS:
+            metric.values.clear()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.rendered = None
+        self.queries = 0
+        self.query_time = 0.0
+        self.cache = defaultdict(int)
+
+
+def key_namespace(key):
+    """``store:product:5`` -> ``store:product``; keys of other apps -> ``other``."""
+    parts = str(key).split(":", 2)
+    return ":".join(parts[:2]) if parts[0] == "store" and len(parts) > 1 else "other"
+
+
+def record_cache(operation, key, count=1):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache[key_namespace(key), operation] += count
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper timing the queries of measured requests."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.query_time += time.perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # connection_created fires on every reconnect of the same wrapper
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+_MISSING = object()
+
+
+class MeteredRedisClient(DefaultClient):
+    """django-redis client counting hits, misses, sets and deletes.
+
+    Use it as ``CLIENT_CLASS`` of the cache. ``add`` and ``set_many`` go
+    through ``set``, so they are counted as sets.
+    """
+
+    def get(self, key, default=None, version=None, client=None):
+        value = super().get(key, _MISSING, version=version, client=client)
+        record_cache("miss" if value is _MISSING else "hit", key)
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None, client=None):
+        values = super().get_many(keys, version=version, client=client)
+        for key in keys:
+            record_cache("hit" if key in values else "miss", key)
+        return values
+
+    def set(self, key, value, *args, **kwargs):
+        record_cache("set", key)
+        return super().set(key, value, *args, **kwargs)
+
+    def delete(self, key, *args, **kwargs):
+        record_cache("delete", key)
+        return super().delete(key, *args, **kwargs)
+
+    def delete_many(self, keys, *args, **kwargs):
+        keys = list(keys)
+        for key in keys:
+            record_cache("delete", key)
+        return super().delete_many(keys, *args, **kwargs)
+
+
+class MeteredLocMemCache(LocMemCache):
+    """In-memory cache backend with the counting of ``MeteredRedisClient``.
+
+    ``get_many`` and ``set_many`` go through ``get`` and ``set``. The tests
+    and ``bench_store`` use it in place of Redis.
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        record_cache("miss" if value is _MISSING else "hit", key)
+        return default if value is _MISSING else value
+
+    def set(self, key, *args, **kwargs):
+        record_cache("set", key)
+        return super().set(key, *args, **kwargs)
+
+    def add(self, key, *args, **kwargs):
+        record_cache("set", key)
+        return super().add(key, *args, **kwargs)
+
+    def delete(self, key, *args, **kwargs):
+        record_cache("delete", key)
+        return super().delete(key, *args, **kwargs)
+
+
+class MetricsMiddleware:
+    """Record latency, queries, cache use and body size of every request.
+
+    With ``STORE_SERVER_TIMING`` the same figures are sent back in a
+    ``Server-Timing`` header. Place it first so it times the other middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, metrics)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after this hook, so the time from here
+        # on is serialization to the wire format.
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.rendered = time.perf_counter()
+        return response
+
+    def finish(self, request, response, metrics):
+        end = time.perf_counter()
+        total = end - metrics.start
+        render_time = end - metrics.rendered if metrics.rendered else 0.0
+        match = request.resolver_match
+        view = match.route if match else "unmatched"
+        method = request.method
+        with _lock:
+            REQUEST_DURATION.observe((view, method), total)
+            REQUESTS.inc((view, method, str(response.status_code)))
+            DB_QUERIES.inc((view,), metrics.queries)
+            DB_DURATION.inc((view,), metrics.query_time)
+            RENDER_DURATION.inc((view,), render_time)
+            for labels, count in metrics.cache.items():
+                CACHE_OPERATIONS.inc(labels, count)
+            if not response.streaming:
+                RESPONSE_SIZE.observe((view,), len(response.content))
+        if getattr(settings, "STORE_SERVER_TIMING", False):
+            hits = sum(n for (_, op), n in metrics.cache.items() if op == "hit")
+            misses = sum(n for (_, op), n in metrics.cache.items() if op == "miss")
+            response["Server-Timing"] = ", ".join([
+                f'db;dur={metrics.query_time * 1000:.3f};desc="{metrics.queries} queries"',
+                f'cache;desc="{hits} hits, {misses} misses"',
+                f"render;dur={render_time * 1000:.3f}",
+                f"total;dur={total * 1000:.3f}",
+            ])
@@ -0,0 +1,71 @@
+from django.db import migrations
+
+# External-content FTS5 index over product name and description, kept in
+# sync by triggers so every write path (save, bulk_create, bulk_update,
+# upserts, cascading deletes) updates it. Prefix indexes keep "term*"
+# queries fast.
+#
+# SQLite drops triggers with their table, and Django rebuilds the table for
+# most schema changes on store_product: a migration altering Product must
+# recreate the triggers and rebuild the index afterwards.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE store_product_fts USING fts5(
+        name,
+        description,
+        content='store_product',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER store_product_fts_insert AFTER INSERT ON store_product BEGIN
+        INSERT INTO store_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER store_product_fts_delete AFTER DELETE ON store_product BEGIN
+        INSERT INTO store_product_fts(store_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER store_product_fts_update AFTER UPDATE OF name, description ON store_product
+    BEGIN
+        INSERT INTO store_product_fts(store_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO store_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO store_product_fts(store_product_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS store_product_fts_insert",
+    "DROP TRIGGER IF EXISTS store_product_fts_delete",
+    "DROP TRIGGER IF EXISTS store_product_fts_update",
+    "DROP TABLE IF EXISTS store_product_fts",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor == "sqlite":
+            for sql in statements:
+                schema_editor.execute(sql)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0002_product_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
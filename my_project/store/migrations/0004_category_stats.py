@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def populate(apps, schema_editor):
+    Category = apps.get_model("store", "Category")
+    CategoryStats = apps.get_model("store", "CategoryStats")
+    rows = Category.objects.values("id").annotate(
+        product_count=Count("products"),
+        price_sum=Sum("products__price"),
+        min_price=Min("products__price"),
+        max_price=Max("products__price"),
+    )
+    CategoryStats.objects.bulk_create(
+        (
+            CategoryStats(
+                category_id=row["id"],
+                product_count=row["product_count"],
+                price_sum=row["price_sum"] or 0,
+                min_price=row["min_price"],
+                max_price=row["max_price"],
+            )
+            for row in rows
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='store.category')),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('price_sum', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+            ],
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
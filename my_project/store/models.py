@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 
 
 # Create your models here.
@@ -6,13 +7,52 @@ class Category(models.Model):
     name = models.CharField(max_length=255, unique=True)
     description = models.TextField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Case-insensitive lookups by name: LOWER("name") = ?
+            models.Index(Lower("name"), name="category_name_lower_idx"),
+        ]
+
 
 class Product(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(null=True, blank=True)
     price = models.DecimalField(decimal_places=2, max_digits=10)
+    # Covered by the (category, price) index
     category = models.ForeignKey(
-        Category, on_delete=models.CASCADE, related_name="products"
+        Category, on_delete=models.CASCADE, related_name="products", db_index=False
     )
     create_at = models.DateTimeField(auto_now_add=True)
     update_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["category", "price"], name="product_category_price_idx"),
+            models.Index(fields=["price"], name="product_price_idx"),
+            models.Index(fields=["update_at"], name="product_update_at_idx"),
+        ]
+
+
+class CategoryStats(models.Model):
+    """Product aggregates of a category, maintained by ``store.stats``."""
+
+    category = models.OneToOneField(
+        Category, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    product_count = models.PositiveIntegerField(default=0)
+    price_sum = models.DecimalField(decimal_places=2, max_digits=20, default=0)
+    min_price = models.DecimalField(decimal_places=2, max_digits=10, null=True)
+    max_price = models.DecimalField(decimal_places=2, max_digits=10, null=True)
+
+
+class ProductTombstone(models.Model):
+    """A deleted product, kept for the change feed of ``store.changes``."""
+
+    product_id = models.BigIntegerField(primary_key=True)
+    deleted_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # The feed pages through tombstones by (deleted_at, product_id)
+            models.Index(fields=["deleted_at", "product_id"], name="tombstone_deleted_at_idx"),
+        ]
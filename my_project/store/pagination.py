@@ -0,0 +1,104 @@
+import base64
+import binascii
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Every ordering ends with the primary key so the sort key is unique and the
+# cursor always points at exactly one row.
+PRODUCT_ORDERINGS = {"id": ("id",), "price": ("price", "id")}
+CATEGORY_ORDERINGS = {"id": ("id",)}
+
+
+def _id(value):
+    value = int(value)
+    # The range of SQLite integers, beyond which queries raise OverflowError
+    if not -2**63 <= value < 2**63:
+        raise ValueError(value)
+    return value
+
+
+def _price(value):
+    value = Decimal(value)
+    # NaN and infinities pass Decimal() but not the price field's validation
+    if not value.is_finite():
+        raise ValueError(value)
+    return value
+
+
+_CONVERTERS = {"id": _id, "price": _price}
+
+
+class InvalidPage(ValueError):
+    pass
+
+
+def is_paginated(query_params):
+    return "limit" in query_params or "cursor" in query_params
+
+
+def encode_cursor(ordering, values):
+    payload = json.dumps({"o": ordering, "v": [str(value) for value in values]})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, ordering, fields):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if payload["o"] != ordering or len(payload["v"]) != len(fields):
+            raise InvalidPage("Cursor does not match ordering")
+        return [_CONVERTERS[field](value) for field, value in zip(fields, payload["v"])]
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError,
+            KeyError, InvalidOperation) as e:
+        raise InvalidPage("Invalid cursor") from e
+
+
+def parse_page_params(query_params, orderings):
+    """Return ``(ordering, limit, after)`` from ``?ordering=&limit=&cursor=``."""
+    ordering = query_params.get("ordering") or "id"
+    if ordering not in orderings:
+        raise InvalidPage(f"Unknown ordering {ordering}")
+    try:
+        limit = int(query_params.get("limit") or DEFAULT_PAGE_SIZE)
+    except ValueError as e:
+        raise InvalidPage("Invalid limit") from e
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise InvalidPage("Invalid limit")
+    cursor = query_params.get("cursor")
+    after = decode_cursor(cursor, ordering, orderings[ordering]) if cursor else None
+    return ordering, limit, after
+
+
+def seek_after(fields, values):
+    # Lexicographic "(a, b) > (x, y)", plus a plain range bound on the leading
+    # column so the database can seek on an index instead of scanning.
+    condition = Q()
+    for i, field in enumerate(fields):
+        condition |= Q(**dict(zip(fields[:i], values[:i])), **{f"{field}__gt": values[i]})
+    return Q(**{f"{fields[0]}__gte": values[0]}) & condition
+
+
+def keyset_page(queryset, ordering, orderings, limit, after=None):
+    """Return one page of ``queryset`` and the cursor of the next page.
+
+    The page starts strictly after the ``after`` sort key, so fetching a deep
+    page costs the same as fetching the first one. ``queryset`` may yield
+    model instances or ``.values()`` rows.
+    """
+    fields = orderings[ordering]
+    queryset = queryset.order_by(*fields)
+    if after is not None:
+        queryset = queryset.filter(seek_after(fields, after))
+    rows = list(queryset[: limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        values = [last[f] if isinstance(last, dict) else getattr(last, f) for f in fields]
+        next_cursor = encode_cursor(ordering, values)
+    return rows, next_cursor
@@ -0,0 +1,65 @@
+"""Renderers faster or more compact than DRF's JSON renderer.
+
+Both need optional packages. Without orjson, ``ORJSONRenderer`` is DRF's
+``JSONRenderer``; without msgpack, settings leave ``MessagePackRenderer`` out
+of the renderer classes.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK = "application/msgpack"
+
+# Types neither library encodes (Decimal, lazy strings, querysets...) are
+# converted the way DRF's JSON renderer converts them.
+_encoder = JSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` producing the same compact output with orjson.
+
+    orjson encodes datetimes, UUIDs and the dicts and lists of serializer
+    data in C. Indented output, which the browsable API asks for, still goes
+    through ``json``.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        body = orjson.dumps(
+            data,
+            default=_encoder.default,
+            option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS,
+        )
+        # Like JSONRenderer, escape the separators JavaScript reads as newlines
+        return body.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class MessagePackRenderer(BaseRenderer):
+    """MessagePack bodies for clients sending ``Accept: application/msgpack``.
+
+    The values are those of the JSON renderer, only the encoding differs.
+    """
+
+    media_type = MSGPACK
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_encoder.default, use_bin_type=True)
@@ -0,0 +1,143 @@
+"""Read replica routing.
+
+``ReplicaMiddleware`` marks safe requests (GET, HEAD, OPTIONS) and
+``ReplicaRouter`` sends the ORM reads they make to one of
+``STORE_READ_REPLICAS``, except those filling a cache right after a write.
+Everything else, writes, management commands and the reads of unsafe
+requests, goes to the default database.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import CATEGORIES_KEY, PRODUCTS_KEY, is_filling
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+PIN_COOKIE = "store_primary"
+
+_reads = ContextVar("store_replica_reads", default=None)
+
+
+class ReplicaReads:
+    """Where the ORM reads of one safe request go, chosen on the first query.
+
+    Choosing lazily keeps requests served from the cache free of the extra
+    cache lookup.
+    """
+
+    def __init__(self):
+        self.replica = None
+        self.recent_write = None
+
+    def database(self):
+        if is_filling():
+            if self.recent_write is None:
+                self.recent_write = written_recently()
+            if self.recent_write:
+                return "default"
+        if self.replica is None:
+            replicas = getattr(settings, "STORE_READ_REPLICAS", [])
+            self.replica = random.choice(replicas) if replicas else "default"
+        return self.replica
+
+
+def written_recently():
+    """Whether a write happened less than ``STORE_REPLICA_LAG`` seconds ago.
+
+    Replicas may lag the primary by that much. Until then, rows read from
+    them could be older than the write that invalidated the caches, and
+    would be cached under the new generation, so the reads filling caches
+    go to the primary. Other reads stay on the replicas: what they return
+    is not kept.
+    """
+    lag = getattr(settings, "STORE_REPLICA_LAG", 2)
+    writes = cache.get_many([f"{ns}:modified" for ns in (PRODUCTS_KEY, CATEGORIES_KEY)])
+    return bool(writes) and time.time() - max(writes.values()) < lag
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        reads = _reads.get()
+        return reads.database() if reads else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in getattr(settings, "STORE_READ_REPLICAS", []):
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """Let safe requests read from the replicas.
+
+    A client whose write succeeded gets a cookie pinning its reads to the
+    primary for ``STORE_REPLICA_PIN_SECONDS``, so it reads its own writes.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        reads = self.reads(request)
+        token = _reads.set(reads)
+        try:
+            response = self.get_response(request)
+        finally:
+            _reads.reset(token)
+        return self.finish(request, response, reads)
+
+    async def __acall__(self, request):
+        reads = self.reads(request)
+        token = _reads.set(reads)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _reads.reset(token)
+        return self.finish(request, response, reads)
+
+    def reads(self, request):
+        if request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES:
+            return ReplicaReads()
+        return None
+
+    def finish(self, request, response, reads):
+        if reads and response.streaming and not response.is_async:
+            # Streamed bodies are read after this middleware returns
+            response.streaming_content = _stream(reads, response.streaming_content)
+        replicas = getattr(settings, "STORE_READ_REPLICAS", [])
+        if replicas and request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=getattr(settings, "STORE_REPLICA_PIN_SECONDS", 10),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+def _stream(reads, content):
+    iterator = iter(content)
+    while True:
+        token = _reads.set(reads)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _reads.reset(token)
+        yield chunk
@@ -0,0 +1,36 @@
+import re
+
+from .filters import filter_products
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query matching every word as a prefix.
+
+    Only word characters are kept, so user input can never inject FTS5
+    syntax. Returns ``None`` when there is nothing to search for.
+    """
+    words = re.findall(r"\w+", text or "")
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_products(match, filters):
+    """Products matching an FTS5 query and the normalized ``filters``.
+
+    The FTS table drives the join and rows come back best match first
+    (bm25). Raises ``Category.DoesNotExist`` like ``filter_products``.
+    """
+    return (
+        filter_products(filters)
+        .extra(
+            tables=["store_product_fts"],
+            where=["store_product_fts.rowid = store_product.id", "store_product_fts MATCH %s"],
+            params=[match],
+            select={"search_rank": "store_product_fts.rank"},
+        )
+        .order_by("search_rank", "id")
+    )
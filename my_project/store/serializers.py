@@ -1,5 +1,9 @@
+import decimal
 from dataclasses import fields
-from rest_framework import serializers
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from store.models import Category, Product
 
 
@@ -15,3 +19,190 @@ class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = "__all__"
+
+
+class CategoryBulkSerializer(serializers.ModelSerializer):
+    """Validates one item of a bulk write.
+
+    Name uniqueness is checked by the bulk view for the whole batch at once.
+    """
+
+    class Meta:
+        model = Category
+        fields = "__all__"
+        extra_kwargs = {"name": {"validators": []}}
+
+
+class ProductBulkSerializer(serializers.ModelSerializer):
+    """Validates one item of a bulk write.
+
+    The category is taken as a plain id; the bulk view checks that the
+    categories of the whole batch exist with a single query.
+    """
+
+    category = serializers.IntegerField(
+        source="category_id", min_value=-2**63, max_value=2**63 - 1
+    )
+
+    class Meta:
+        model = Product
+        fields = "__all__"
+
+
+class CategoryStatsSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    product_count = serializers.IntegerField()
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    avg_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+def _decimal_converter(field):
+    quantum = decimal.Decimal(".1") ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        return f"{value.quantize(quantum, rounding=rounding, context=context):f}"
+
+    return convert
+
+
+def _convert_datetime(value):
+    # Same as DateTimeField.enforce_timezone() for aware datetimes
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def _converter(field):
+    """Return a fast converter for ``field``, ``None`` when values pass as is."""
+    if isinstance(
+        field,
+        (serializers.IntegerField, serializers.CharField, serializers.PrimaryKeyRelatedField),
+    ):
+        return None
+    if (
+        isinstance(field, serializers.DecimalField)
+        and field.decimal_places is not None
+        and getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+        and not field.localize
+        and not field.normalize_output
+    ):
+        return _decimal_converter(field)
+    if (
+        isinstance(field, serializers.DateTimeField)
+        and getattr(field, "format", api_settings.DATETIME_FORMAT).lower() == ISO_8601
+        and not hasattr(field, "timezone")
+        and settings.USE_TZ
+    ):
+        return _convert_datetime
+    return field.to_representation
+
+
+class ValuesSerializer:
+    """Read-only fast path for a ModelSerializer.
+
+    Reads ``.values()`` rows instead of model instances and converts each
+    column with a function precomputed from the serializer's field, skipping
+    DRF's per-field attribute lookup. The output is identical to
+    ``serializer_class(queryset, many=True).data``.
+    """
+
+    def __init__(self, serializer_class, expandable=None):
+        self.serializer_class = serializer_class
+        # Relation fields that ``select`` can expand, with the ValuesSerializer
+        # of the related model
+        self.expandable = expandable or {}
+        self.expanded = {}
+        # Identifies the selection in cache keys; empty for all fields
+        self.key = ""
+        self._columns = None
+        self._selections = {}
+
+    @property
+    def columns(self):
+        # Built lazily: instantiating the serializer needs the app registry
+        if self._columns is None:
+            self._columns = [
+                (name, _converter(field))
+                for name, field in self.serializer_class().fields.items()
+                if not field.write_only
+            ]
+        return self._columns
+
+    def select(self, fields=None, expand=()):
+        """Return a serializer of only ``fields`` (all by default).
+
+        The relations in ``expand`` are embedded as objects instead of ids,
+        and always included. Both narrow the ``.values()`` projection;
+        expanded relations are read through a join. Raises ``ValueError`` on
+        names it does not know.
+        """
+        names = [name for name, _ in self.columns]
+        unknown = [name for name in fields or () if name not in names]
+        unknown += [name for name in expand if name not in self.expandable]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        if fields is None and not expand:
+            return self
+        # In field order, so equivalent requests share a cache key
+        expand = [name for name in names if name in expand]
+        fields = [name for name in names if name in (fields or names) and name not in expand]
+        key = ",".join(fields) + "|" + ",".join(expand)
+        selection = self._selections.get(key)
+        if selection is None:
+            selection = ValuesSerializer(self.serializer_class)
+            selection._columns = [column for column in self.columns if column[0] in fields]
+            selection.expanded = {name: self.expandable[name] for name in expand}
+            selection.key = key
+            self._selections[key] = selection
+        return selection
+
+    def select_params(self, query_params):
+        """``select`` what ``?fields=a,b&expand=c`` asks for."""
+        fields, expand = query_params.get("fields"), query_params.get("expand")
+        return self.select(
+            [name.strip() for name in fields.split(",")] if fields else None,
+            [name.strip() for name in expand.split(",")] if expand else (),
+        )
+
+    def values(self, queryset, *extra):
+        """``.values()`` of the columns to serialize, plus ``extra`` ones."""
+        names = [name for name, _ in self.columns]
+        for relation, related in self.expanded.items():
+            names += [f"{relation}__{name}" for name, _ in related.columns]
+        return queryset.values(*names, *(name for name in extra if name not in names))
+
+    def to_representation(self, row):
+        data = {
+            name: value if convert is None or value is None else convert(value)
+            for name, convert in self.columns
+            for value in (row[name],)
+        }
+        for relation, related in self.expanded.items():
+            data[relation] = related.to_representation(
+                {name: row[f"{relation}__{name}"] for name, _ in related.columns}
+            )
+        return data
+
+    def project(self, data):
+        """Narrow a full representation to the selected fields.
+
+        Expanded relations are left for the caller to fill in.
+        """
+        return {name: data[name] for name, _ in self.columns}
+
+    def serialize(self, queryset):
+        return [self.to_representation(row) for row in self.values(queryset)]
+
+    async def aserialize(self, queryset):
+        return [self.to_representation(row) async for row in self.values(queryset)]
+
+
+category_rows = ValuesSerializer(CategorySerializer)
+product_rows = ValuesSerializer(ProductSerializer, expandable={"category": category_rows})
@@ -0,0 +1,154 @@
+"""Per-category product aggregates kept in ``CategoryStats``.
+
+Creating or deleting a product adjusts its category's row in place, and
+updating one recomputes the rows of its old and new category from the
+(category, price) index, so reading the stats costs one row per category
+whatever the number of products. Bulk writes, which send no signals, and
+queryset deletes, whose signals are skipped, call ``rebuild_category_stats``
+for the categories they touched.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from .models import Category, CategoryStats, Product
+
+STATS_FIELDS = ("product_count", "price_sum", "min_price", "max_price")
+# What a category without a stats row has: rows are created on its first product
+EMPTY_STATS = {"product_count": 0, "price_sum": 0, "min_price": None, "max_price": None}
+
+_price = Product._meta.get_field("price")
+
+
+def compute_category_stats(category_ids=None):
+    """Aggregate the products of ``category_ids`` (all categories by default).
+
+    Returns ``{category_id: {field: value}}`` from one grouped query.
+    """
+    categories = Category.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(id__in=category_ids)
+    rows = categories.values("id").annotate(
+        product_count=Count("products"),
+        price_sum=Coalesce(Sum("products__price"), Value(Decimal(0))),
+        min_price=Min("products__price"),
+        max_price=Max("products__price"),
+    )
+    return {row.pop("id"): row for row in rows}
+
+
+def rebuild_category_stats(category_ids=None):
+    """Recompute the stats of ``category_ids`` (all categories by default)."""
+    stats = compute_category_stats(category_ids)
+    CategoryStats.objects.bulk_create(
+        [CategoryStats(category_id=id, **values) for id, values in stats.items()],
+        update_conflicts=True,
+        unique_fields=["category"],
+        update_fields=STATS_FIELDS,
+    )
+    return len(stats)
+
+
+def verify_category_stats():
+    """Return the ids of the categories whose stored stats are wrong."""
+    stored = {
+        row.pop("category_id"): row
+        for row in CategoryStats.objects.values("category_id", *STATS_FIELDS)
+    }
+    return sorted(
+        id
+        for id, values in compute_category_stats().items()
+        if stored.get(id, EMPTY_STATS) != values
+    )
+
+
+def category_stats():
+    """Return one row of stats per category, ordered by id."""
+    rows = Category.objects.order_by("id").values(
+        "id",
+        "name",
+        product_count=F("stats__product_count"),
+        price_sum=F("stats__price_sum"),
+        min_price=F("stats__min_price"),
+        max_price=F("stats__max_price"),
+    )
+    for row in rows:
+        count = row["product_count"] or 0
+        row["product_count"] = count
+        row["avg_price"] = row.pop("price_sum") / count if count else None
+    return rows
+
+
+def _adjust(category_id, count, amount, added_price=None):
+    """Add ``count`` products worth ``amount`` in total to a category's row.
+
+    ``added_price`` can only widen the price range; without it the bounds are
+    read back from the (category, price) index, as a removed or changed
+    price may have been the minimum or maximum.
+    """
+    if added_price is None:
+        prices = Product.objects.filter(category_id=category_id).values("price")
+        bounds = {
+            "min_price": Subquery(prices.order_by("price")[:1]),
+            "max_price": Subquery(prices.order_by("-price")[:1]),
+        }
+    else:
+        price = Value(added_price)
+        bounds = {
+            "min_price": Least(Coalesce("min_price", price), price),
+            "max_price": Greatest(Coalesce("max_price", price), price),
+        }
+    updated = CategoryStats.objects.filter(category_id=category_id).update(
+        product_count=F("product_count") + count,
+        price_sum=F("price_sum") + amount,
+        **bounds,
+    )
+    if not updated and count < 0:
+        # No row, and the products being removed may be a queryset delete's,
+        # whose rows are all gone before the first post_delete: a rebuild now
+        # would be decremented again by the next ones.
+        transaction.on_commit(lambda: rebuild_category_stats([category_id]))
+    elif not updated:
+        # No row yet, e.g. for a category created by a bulk write
+        rebuild_category_stats([category_id])
+
+
+def product_saving(sender, instance, raw=False, **kwargs):
+    """``pre_save`` receiver reading what the product's row holds before the write.
+
+    Values read when the request loaded the product could predate a
+    concurrent update of it, and the stats would count that update twice.
+    """
+    if raw or instance.pk is None:
+        return
+    instance._stored_values = (
+        Product.objects.filter(pk=instance.pk).values("category_id", "price").first()
+    )
+
+
+def product_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    category_id, price = instance.category_id, _price.to_python(instance.price)
+    stored = getattr(instance, "_stored_values", None)
+    instance._stored_values = None
+    if created:
+        _adjust(category_id, 1, price, price)
+    elif stored is None:
+        # Saved without being read first: the old values are unknown
+        rebuild_category_stats()
+    elif (stored["category_id"], stored["price"]) != (category_id, price):
+        rebuild_category_stats({stored["category_id"], category_id})
+
+
+def product_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Category) or getattr(origin, "model", None) is Category:
+        # Cascading from its category, whose stats row goes as well
+        return
+    if getattr(origin, "model", None) is Product:
+        # Part of a queryset delete, which rebuilds the stats once
+        # (see views.delete_products)
+        return
+    _adjust(instance.category_id, -1, -_price.to_python(instance.price))
@@ -1,9 +1,35 @@
+import gzip
+import json
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from unittest import skipUnless
+from decimal import Decimal
 from unicodedata import category
-from django.test import TestCase
+from django.http import HttpResponse
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from django.conf import settings
 from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import Category, Product
+from . import async_views, changes, compression, metrics, renderers, replicas, stats, warming
+from .cache import bump_generation, filling, invalidate_products, invalidated
+from .filters import categories_named, filter_products
+from .models import Category, CategoryStats, Product, ProductTombstone
+from .pagination import encode_cursor
+from .serializers import CategorySerializer, ProductSerializer, category_rows, product_rows
 
 class ModelTestCase(TestCase):
     def setUp(self):
@@ -82,6 +108,61 @@ class CategoryApiTestCase(APITestCase):
         self.assertEqual(data["name"], self.data1["name"])
         self.assertEqual(data["description"], self.data1["description"])
     
+    def test_category_by_id_cache(self):
+        get_response = self.client.get(f"{self.url}/1")
+        self.assertEqual(get_response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Creating the id drops its negative entry
+        post_response = self.client.post(self.url, self.data1, format="json")
+        id = post_response.data["data"]["id"]
+        get_response = self.client.get(f"{self.url}/{id}")
+        self.assertEqual(get_response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            self.client.get(f"{self.url}/{id}")
+
+        self.client.delete(f"{self.url}/{id}")
+        get_response = self.client.get(f"{self.url}/{id}")
+        self.assertEqual(get_response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_category_conditional_get(self):
+        post_response = self.client.post(self.url, self.data1, format="json")
+        id = post_response.data["data"]["id"]
+        for url in (self.url, f"{self.url}/{id}"):
+            etag = self.client.get(url)["ETag"]
+            get_response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(get_response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.put(f"{self.url}/{id}", self.data2, format="json")
+        get_response = self.client.get(f"{self.url}/{id}", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(get_response.status_code, status.HTTP_200_OK)
+
+    def test_bulk_categories(self):
+        self.client.post(self.url, self.data1, format="json")
+        items = [self.data2, self.data3, self.data1, self.data2]
+        post_response = self.client.post(f"{self.url}/bulk", items, format="json")
+        data = post_response.data["data"]
+        self.assertEqual([c["name"] for c in data["results"]], ["cat2", "cat3"])
+        self.assertEqual([e["index"] for e in data["errors"]], [2, 3])
+
+        id2, id3 = (c["id"] for c in data["results"])
+        put_response = self.client.put(
+            f"{self.url}/bulk",
+            [{"id": id2, "name": "cat2", "description": "new"}, {"id": id3, "name": "cat1"}],
+            format="json",
+        )
+        data = put_response.data["data"]
+        self.assertEqual(data["results"][0]["description"], "new")
+        self.assertEqual(data["errors"][0]["index"], 1)
+
+        delete_response = self.client.delete(f"{self.url}/bulk", [id2, id3], format="json")
+        self.assertEqual(delete_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Category.objects.count(), 1)
+
+        # Test: ids out of the range of SQLite integers are item errors
+        delete_response = self.client.delete(f"{self.url}/bulk", [10**30], format="json")
+        self.assertEqual(delete_response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(delete_response.data["data"]["errors"][0]["index"], 0)
+
     def test_put_category_by_id(self):
         post_response = self.client.post(self.url, self.data1, format="json")
         id = post_response.data["data"]["id"]
@@ -106,6 +187,24 @@ class CategoryApiTestCase(APITestCase):
         delete_response = self.client.delete(f"{self.url}/999")
         self.assertEqual(delete_response.status_code, status.HTTP_404_NOT_FOUND)
     
+    def test_get_category_pages(self):
+        for data in (self.data1, self.data2, self.data3):
+            self.client.post(self.url, data, format="json")
+
+        get_response = self.client.get(f"{self.url}?limit=2")
+        self.assertEqual(get_response.status_code, status.HTTP_200_OK)
+        page = get_response.data["data"]
+        self.assertEqual([c["name"] for c in page["results"]], ["cat1", "cat2"])
+
+        get_response = self.client.get(f"{self.url}?limit=2&cursor={page['next_cursor']}")
+        page = get_response.data["data"]
+        self.assertEqual([c["name"] for c in page["results"]], ["cat3"])
+        self.assertIsNone(page["next_cursor"])
+
+        # Test: ordering not supported for categories
+        get_response = self.client.get(f"{self.url}?limit=2&ordering=price")
+        self.assertEqual(get_response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_category_redis_flow(self):
         # Init data
         self.client.post(self.url,{"name":"test_data"})
@@ -209,7 +308,415 @@ class ProductApiTest(APITestCase):
         get_response = self.client.get(f"{self.url}?price_min=abc")
         self.assertEqual(get_response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(get_response.data["message"], "Invalid price filter values")
+
+        # Test: Non-finite prices are invalid on every filtered endpoint
+        for path in ("?", "/facets?", "/search?q=test&", "/export?"):
+            for price in ("nan", "inf", "1e400"):
+                get_response = self.client.get(f"{self.url}{path}price_max={price}")
+                self.assertEqual(get_response.status_code, status.HTTP_400_BAD_REQUEST)
     
+    def test_get_product_pages(self):
+        self.client.post(self.url, self.data3, format="json")
+        self.client.post(self.url, self.data1, format="json")
+        self.client.post(self.url, self.data2, format="json")
+
+        # Test: walk the catalog ordered by (price, id)
+        get_response = self.client.get(f"{self.url}?limit=2&ordering=price")
+        self.assertEqual(get_response.status_code, status.HTTP_200_OK)
+        page = get_response.data["data"]
+        self.assertEqual([p["name"] for p in page["results"]], ["test1", "test2"])
+        self.assertIsNotNone(page["next_cursor"])
+
+        cursor = page["next_cursor"]
+        get_response = self.client.get(f"{self.url}?limit=2&ordering=price&cursor={cursor}")
+        page = get_response.data["data"]
+        self.assertEqual([p["name"] for p in page["results"]], ["test3"])
+        self.assertIsNone(page["next_cursor"])
+
+        # Test: pages combine with filters
+        get_response = self.client.get(f"{self.url}?limit=1&price_min=20&ordering=price")
+        page = get_response.data["data"]
+        self.assertEqual([p["name"] for p in page["results"]], ["test2"])
+
+        # Test: cursor from another ordering and invalid limit
+        get_response = self.client.get(f"{self.url}?limit=2&ordering=id&cursor={cursor}")
+        self.assertEqual(get_response.status_code, status.HTTP_400_BAD_REQUEST)
+        get_response = self.client.get(f"{self.url}?limit=0")
+        self.assertEqual(get_response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(get_response.data["message"], "Invalid pagination values")
+        # Crafted cursors with values the database cannot compare
+        for ordering, values in [("price", ["NaN", "1"]), ("price", ["-Infinity", "1"]),
+                                 ("price", ["sNaN", "1"]), ("id", [str(2**63)])]:
+            cursor = encode_cursor(ordering, values)
+            get_response = self.client.get(
+                f"{self.url}?limit=2&ordering={ordering}&cursor={cursor}"
+            )
+            self.assertEqual(get_response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_product_page_cache_invalidated_on_write(self):
+        self.client.post(self.url, self.data1, format="json")
+        get_response = self.client.get(f"{self.url}?limit=10")
+        self.assertEqual(len(get_response.data["data"]["results"]), 1)
+
+        self.client.post(self.url, self.data2, format="json")
+        get_response = self.client.get(f"{self.url}?limit=10")
+        self.assertEqual(len(get_response.data["data"]["results"]), 2)
+
+    def test_filtered_product_cache(self):
+        self.client.post(self.url, self.data1, format="json")
+        self.client.post(self.url, self.data2, format="json")
+        get_response = self.client.get(f"{self.url}?price_min=20&category_name=CAT2")
+        self.assertEqual(len(get_response.data["data"]), 1)
+
+        # Equivalent filters share one cache entry
+        with self.assertNumQueries(0):
+            get_response = self.client.get(f"{self.url}?category_name=cat2&price_min=20.0")
+        self.assertEqual(len(get_response.data["data"]), 1)
+
+        # Writes invalidate every cached filter
+        self.client.post(self.url, {**self.data2, "name": "test4"}, format="json")
+        get_response = self.client.get(f"{self.url}?category_name=cat2&price_min=20")
+        self.assertEqual(len(get_response.data["data"]), 2)
+
+        # Deleting the category drops its products from cached filters
+        self.client.delete(f"/api/categories/{self.catid2}")
+        get_response = self.client.get(f"{self.url}?price_min=20")
+        self.assertEqual(len(get_response.data["data"]), 0)
+
+    def test_product_list_served_stale_during_rebuild(self):
+        self.client.post(self.url, self.data1, format="json")
+        self.client.get(self.url)
+
+        # Another worker holds the rebuild lock after a write
+        self.client.post(self.url, self.data2, format="json")
+        cache.add(f"{self.cache_key}:lock", 1)
+        with self.assertNumQueries(0):
+            get_response = self.client.get(self.url)
+        self.assertEqual(len(get_response.data["data"]), 1)
+        # The stale copy carries no validators a client could revalidate later
+        self.assertFalse(get_response.has_header("ETag"))
+        self.assertIn("no-store", get_response["Cache-Control"])
+
+        # Once the lock is released the next request rebuilds
+        cache.delete(f"{self.cache_key}:lock")
+        get_response = self.client.get(self.url)
+        self.assertEqual(len(get_response.data["data"]), 2)
+        self.assertTrue(get_response.has_header("ETag"))
+        self.assertEqual(len(cache.get(f"{self.cache_key}:stale")), 2)
+
+    @override_settings(STORE_CACHE_RENDERED=True)
+    def test_product_list_cached_as_rendered_body(self):
+        self.client.post(self.url, self.data1, format="json")
+        get_response = self.client.get(self.url)
+        body = json.loads(get_response.content)
+        self.assertEqual(body["message"], "Success")
+        self.assertEqual(body["data"][0]["name"], self.data1["name"])
+        self.assertEqual(cache.get(f"{self.cache_key}:json"), get_response.content)
+
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(self.url)
+        self.assertEqual(cached_response.content, get_response.content)
+
+        # Writes drop the rendered body too
+        self.client.post(self.url, self.data2, format="json")
+        self.assertIsNone(cache.get(f"{self.cache_key}:json"))
+
+    @override_settings(STORE_CACHE_RENDERED=True, STORE_CACHE_COMPRESS=True)
+    def test_product_list_cached_compressed(self):
+        self.client.post(self.url, self.data1, format="json")
+        get_response = self.client.get(f"{self.url}?price_min=5", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(get_response["Content-Encoding"], "gzip")
+        body = json.loads(gzip.decompress(get_response.content))
+        self.assertEqual(len(body["data"]), 1)
+
+        # Clients without gzip support get the plain body
+        get_response = self.client.get(f"{self.url}?price_min=5")
+        self.assertFalse(get_response.has_header("Content-Encoding"))
+        self.assertEqual(json.loads(get_response.content), body)
+
+    @override_settings(STORE_COMPRESS_MIN_SIZE=200)
+    def test_large_responses_compressed(self):
+        for data in (self.data1, self.data2, self.data3):
+            self.client.post(self.url, data, format="json")
+        plain = self.client.get(self.url)
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", plain["Vary"])
+
+        get_response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(get_response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(get_response.content), plain.content)
+        self.assertEqual(get_response["ETag"], plain["ETag"][:-1] + '-gzip"')
+        # The encoded ETag still validates conditional GETs
+        not_modified = self.client.get(
+            self.url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=get_response["ETag"]
+        )
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        get_response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertFalse(get_response.has_header("Content-Encoding"))
+        # Small bodies are not worth it
+        detail = self.client.get(f"{self.url}/{plain.data['data'][0]['id']}",
+                                 HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(detail.has_header("Content-Encoding"))
+
+        # The ETag of a compressed detail is good for If-Match
+        detail_url = f"{self.url}/{plain.data['data'][0]['id']}"
+        with self.settings(STORE_COMPRESS_MIN_SIZE=0):
+            detail = self.client.get(detail_url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(detail["Content-Encoding"], "gzip")
+        patch_response = self.client.patch(
+            detail_url, {"price": "11.00"}, format="json", HTTP_IF_MATCH=detail["ETag"]
+        )
+        self.assertEqual(patch_response.status_code, status.HTTP_200_OK)
+
+    def test_export_compressed(self):
+        self.client.post(self.url, self.data1, format="json")
+        response = self.client.get(f"{self.url}/export", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        body = gzip.decompress(b"".join(response.streaming_content))
+        self.assertEqual(json.loads(body)["name"], self.data1["name"])
+
+    def test_product_list_conditional_get(self):
+        self.client.post(self.url, self.data1, format="json")
+        get_response = self.client.get(self.url)
+        etag = get_response["ETag"]
+        self.assertTrue(get_response.has_header("Last-Modified"))
+
+        with self.assertNumQueries(0):
+            get_response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(get_response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(get_response["ETag"], etag)
+
+        # Filters and pages have their own validators
+        get_response = self.client.get(f"{self.url}?price_min=5", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(get_response.status_code, status.HTTP_200_OK)
+
+        # Writes change the validators
+        self.client.post(self.url, self.data2, format="json")
+        get_response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(get_response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(get_response["ETag"], etag)
+
+    def test_product_by_id_conditional_get(self):
+        post_response = self.client.post(self.url, self.data1, format="json")
+        id = post_response.data["data"]["id"]
+        get_response = self.client.get(f"{self.url}/{id}")
+        etag = get_response["ETag"]
+        last_modified = get_response["Last-Modified"]
+
+        with self.assertNumQueries(0):
+            get_response = self.client.get(f"{self.url}/{id}", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(get_response.status_code, status.HTTP_304_NOT_MODIFIED)
+        get_response = self.client.get(f"{self.url}/{id}", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(get_response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.put(f"{self.url}/{id}", self.data2, format="json")
+        get_response = self.client.get(f"{self.url}/{id}", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(get_response.status_code, status.HTTP_200_OK)
+
+    def test_bulk_products(self):
+        items = [self.data1, self.data2, {**self.data3, "category": 999}, {"name": "x"}]
+        # One category check and one INSERT, then the stats of the two
+        # categories are recomputed and upserted, all inside a savepoint
+        with self.assertNumQueries(6):
+            post_response = self.client.post(f"{self.url}/bulk", items, format="json")
+        self.assertEqual(post_response.status_code, status.HTTP_207_MULTI_STATUS)
+        data = post_response.data["data"]
+        self.assertEqual([p["name"] for p in data["results"]], ["test1", "test2"])
+        self.assertEqual([e["index"] for e in data["errors"]], [2, 3])
+        self.assertIn("category", data["errors"][0]["errors"])
+        self.assertEqual(Product.objects.count(), 2)
+
+        id1, id2 = (p["id"] for p in data["results"])
+        cache.set(self.cache_key, "test", 60*5)
+        put_response = self.client.put(
+            f"{self.url}/bulk",
+            [{**self.data3, "id": id1}, {**self.data3, "id": 999}],
+            format="json",
+        )
+        self.assertEqual(put_response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(Product.objects.get(id=id1).name, "test3")
+        self.assertIsNone(cache.get(self.cache_key))
+
+        delete_response = self.client.delete(f"{self.url}/bulk", [id1, id2, 999], format="json")
+        self.assertEqual(delete_response.data["data"]["results"], [id1, id2])
+        self.assertEqual(len(delete_response.data["data"]["errors"]), 1)
+        self.assertEqual(Product.objects.count(), 0)
+
+        # Test: ids out of the range of SQLite integers are item errors
+        for method, items in (
+            (self.client.post, [{**self.data1, "category": 10**30}]),
+            (self.client.put, [{**self.data1, "id": 10**30}]),
+            (self.client.delete, [10**30]),
+        ):
+            response = method(f"{self.url}/bulk", items, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data["data"]["errors"][0]["index"], 0)
+
+        # Test: body must be a list
+        post_response = self.client.post(f"{self.url}/bulk", self.data1, format="json")
+        self.assertEqual(post_response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_products(self):
+        self.client.post(self.url, self.data1, format="json")
+        self.client.post(self.url, self.data2, format="json")
+        rows = self.client.get(self.url).data["data"]
+
+        export_response = self.client.get(f"{self.url}/export")
+        self.assertEqual(export_response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(export_response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], rows)
+
+        export_response = self.client.get(f"{self.url}/export?format=csv&category_name=cat2")
+        lines = b"".join(export_response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(","), list(rows[1]))
+        self.assertEqual(len(lines), 2)
+
+        export_response = self.client.get(f"{self.url}/export?format=xml")
+        self.assertEqual(export_response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_products(self):
+        self.client.post(self.url, {**self.data1, "name": "Blue widget"}, format="json")
+        self.client.post(
+            self.url,
+            {**self.data2, "name": "Widget", "description": "A widget for widgets"},
+            format="json",
+        )
+        post_response = self.client.post(self.url, {**self.data3, "name": "Gadget"}, format="json")
+        gadget_id = post_response.data["data"]["id"]
+
+        # Prefix matching, best match first
+        get_response = self.client.get(f"{self.url}/search?q=wid")
+        self.assertEqual(get_response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p["name"] for p in get_response.data["data"]], ["Widget", "Blue widget"])
+
+        # Combined with the product filters
+        get_response = self.client.get(f"{self.url}/search?q=widget&category_name=cat1")
+        self.assertEqual([p["name"] for p in get_response.data["data"]], ["Blue widget"])
+        get_response = self.client.get(f"{self.url}/search?q=widget&price_min=20&limit=1")
+        self.assertEqual([p["name"] for p in get_response.data["data"]], ["Widget"])
+
+        # The index follows updates and deletes
+        self.client.put(f"{self.url}/{gadget_id}", {**self.data3, "name": "Widget XL"}, format="json")
+        get_response = self.client.get(f"{self.url}/search?q=xl")
+        self.assertEqual([p["id"] for p in get_response.data["data"]], [gadget_id])
+        self.client.delete(f"{self.url}/{gadget_id}")
+        get_response = self.client.get(f"{self.url}/search?q=xl")
+        self.assertEqual(get_response.data["data"], [])
+
+        # FTS5 syntax in the query is ignored
+        get_response = self.client.get(f'{self.url}/search?q=" OR blue NEAR(')
+        self.assertEqual(get_response.status_code, status.HTTP_200_OK)
+        get_response = self.client.get(f"{self.url}/search?q=")
+        self.assertEqual(get_response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sparse_fields_and_expand(self):
+        id1 = self.client.post(self.url, self.data1, format="json").data["data"]["id"]
+        self.client.post(self.url, self.data2, format="json")
+        get_response = self.client.get(f"{self.url}?fields=price,name")
+        self.assertEqual(get_response.data["data"][0], {"name": "test1", "price": "10.00"})
+
+        with CaptureQueriesContext(connection) as queries:
+            get_response = self.client.get(f"{self.url}?fields=name&expand=category")
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"store_product"."description"', queries[0]["sql"])
+        self.assertIn("JOIN", queries[0]["sql"])
+        category1 = {"id": self.catid1, "name": "cat1", "description": "cat1"}
+        self.assertEqual(get_response.data["data"][0], {"name": "test1", "category": category1})
+
+        get_response = self.client.get(f"{self.url}?fields=name&ordering=price&limit=1")
+        self.assertEqual(get_response.data["data"]["results"], [{"name": "test1"}])
+        cursor = get_response.data["data"]["next_cursor"]
+        get_response = self.client.get(
+            f"{self.url}?fields=name&ordering=price&limit=1&cursor={cursor}"
+        )
+        self.assertEqual(get_response.data["data"]["results"], [{"name": "test2"}])
+
+        for query in ("fields=name,colour", "expand=price"):
+            get_response = self.client.get(f"{self.url}?{query}")
+            self.assertEqual(get_response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        detail_url = f"{self.url}/{id1}?fields=name&expand=category"
+        get_response = self.client.get(detail_url)
+        self.assertEqual(get_response.data["data"], {"name": "test1", "category": category1})
+        self.assertFalse(get_response.has_header("Last-Modified"))
+        etag = get_response["ETag"]
+        # Renaming the category shows in both, and changes the detail's ETag
+        self.client.put(f"/api/categories/{self.catid1}", {"name": "renamed"}, format="json")
+        get_response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(get_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(get_response.data["data"]["category"]["name"], "renamed")
+        get_response = self.client.get(f"{self.url}?fields=name&expand=category")
+        self.assertEqual(get_response.data["data"][0]["category"]["name"], "renamed")
+
+    def test_batch_fetch_by_ids(self):
+        id1 = self.client.post(self.url, self.data1, format="json").data["data"]["id"]
+        id2 = self.client.post(self.url, self.data2, format="json").data["data"]["id"]
+        self.client.get(f"{self.url}/{id2}")
+        missing = id2 + 100
+
+        # Only the uncached product is read, with one query
+        with CaptureQueriesContext(connection) as queries:
+            get_response = self.client.get(f"{self.url}?ids={id2},{missing},{id1},{id2}")
+        self.assertEqual(get_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+        data = get_response.data["data"]
+        self.assertEqual([product["id"] for product in data["results"]], [id2, id1])
+        self.assertEqual(data["results"][1]["name"], "test1")
+        self.assertEqual(data["missing"], [missing])
+        # Then all of them, misses included, come from the cache
+        with self.assertNumQueries(0):
+            self.client.get(f"{self.url}?ids={id1},{missing}")
+            get_response = self.client.get(f"{self.url}/{id1}")
+        self.assertEqual(get_response.data["data"]["name"], "test1")
+
+        get_response = self.client.get(f"{self.url}?ids={id1}&fields=name&expand=category")
+        self.assertEqual(
+            get_response.data["data"]["results"],
+            [{"name": "test1", "category": {"id": self.catid1, "name": "cat1", "description": "cat1"}}],
+        )
+
+        for ids in ("", "1,x", ",".join(map(str, range(1001))), str(10**30)):
+            get_response = self.client.get(f"{self.url}?ids={ids}")
+            self.assertEqual(get_response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_product_facets(self):
+        for data in (self.data1, self.data2, self.data3):
+            self.client.post(self.url, data, format="json")
+
+        get_response = self.client.get(
+            f"{self.url}/facets?category_name=cat1&price_min=20&price_buckets=20,40"
+        )
+        self.assertEqual(get_response.status_code, status.HTTP_200_OK)
+        # Categories ignore the category filter, the histogram the price range
+        self.assertEqual(
+            get_response.data["data"],
+            {
+                "count": 1,
+                "categories": [
+                    {"id": self.catid1, "name": "cat1", "count": 1},
+                    {"id": self.catid2, "name": "cat2", "count": 1},
+                ],
+                "price_histogram": [
+                    {"min": None, "max": "20.00", "count": 1},
+                    {"min": "20.00", "max": "40.00", "count": 0},
+                    {"min": "40.00", "max": None, "count": 1},
+                ],
+            },
+        )
+        # Cached with the filtered lists, and dropped on writes
+        with self.assertNumQueries(0):
+            self.client.get(f"{self.url}/facets?category_name=cat1&price_min=20&price_buckets=20,40")
+        self.client.post(self.url, self.data1, format="json")
+        get_response = self.client.get(f"{self.url}/facets")
+        self.assertEqual(get_response.data["data"]["count"], 4)
+        self.assertEqual(len(get_response.data["data"]["price_histogram"]), 8)
+
+        get_response = self.client.get(f"{self.url}/facets?price_buckets=40,20")
+        self.assertEqual(get_response.status_code, status.HTTP_400_BAD_REQUEST)
+        get_response = self.client.get(f"{self.url}/facets?category_name=nope")
+        self.assertEqual(get_response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_get_product_by_id(self):
         post_response = self.client.post(self.url, self.data1, format="json")
         id = post_response.data["data"]["id"]
@@ -221,6 +728,29 @@ class ProductApiTest(APITestCase):
         self.assertEqual(float(data["price"]), float(self.data1["price"]))
         self.assertEqual(data["category"], self.data1["category"])
     
+    def test_product_by_id_cache(self):
+        post_response = self.client.post(self.url, self.data1, format="json")
+        id = post_response.data["data"]["id"]
+        self.client.get(f"{self.url}/{id}")
+        with self.assertNumQueries(0):
+            get_response = self.client.get(f"{self.url}/{id}")
+        self.assertEqual(get_response.data["data"]["name"], self.data1["name"])
+
+        # PUT refreshes the cached entry
+        self.client.put(f"{self.url}/{id}", self.data2, format="json")
+        self.assertEqual(cache.get(f"store:product:{id}")["name"], self.data2["name"])
+
+        # Deleting the category evicts its products
+        self.client.delete(f"/api/categories/{self.catid2}")
+        self.assertIsNone(cache.get(f"store:product:{id}"))
+
+        # Missing ids are cached as well
+        get_response = self.client.get(f"{self.url}/999")
+        self.assertEqual(get_response.status_code, status.HTTP_404_NOT_FOUND)
+        with self.assertNumQueries(0):
+            get_response = self.client.get(f"{self.url}/999")
+        self.assertEqual(get_response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_put_product_by_id(self):
         post_response = self.client.post(self.url, self.data1, format="json")
         id = post_response.data["data"]["id"]
@@ -232,6 +762,61 @@ class ProductApiTest(APITestCase):
         self.assertEqual(data["description"], self.data1["description"])
         self.assertEqual(data["category"], self.data2["category"])
         
+    def test_patch_product(self):
+        id = self.client.post(self.url, self.data1, format="json").data["data"]["id"]
+        self.client.get(self.url)
+        etag = self.client.get(f"{self.url}/{id}")["ETag"]
+
+        # One read, then in a savepoint the stored row, the UPDATE and the
+        # stats rebuild
+        with self.assertNumQueries(7):
+            patch_response = self.client.patch(
+                f"{self.url}/{id}", {"price": "12.50"}, format="json", HTTP_IF_MATCH=etag
+            )
+        self.assertEqual(patch_response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(patch_response["ETag"], etag)
+        # The category check is part of the read
+        patch_response = self.client.patch(
+            f"{self.url}/{id}",
+            {"category": self.catid2},
+            format="json",
+            HTTP_IF_MATCH=patch_response["ETag"],
+        )
+        data = patch_response.data["data"]
+        self.assertEqual((data["name"], data["price"], data["category"]), ("test1", "12.50", self.catid2))
+        # The cached list is patched in place, the detail cache replaced
+        self.assertEqual(cache.get(self.cache_key), [data])
+        self.assertEqual(cache.get(f"store:product:{id}"), data)
+        self.assertEqual(stats.verify_category_stats(), [])
+
+        # The ETag the client read is stale now
+        patch_response = self.client.patch(
+            f"{self.url}/{id}", {"name": "lost"}, format="json", HTTP_IF_MATCH=etag
+        )
+        self.assertEqual(patch_response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(Product.objects.get(id=id).name, "test1")
+
+        # A write by another worker between reading and writing back the
+        # list leaves it invalidated, as the list may predate that write
+        self.client.get(self.url)
+
+        def concurrent_write(sender, namespace, **kwargs):
+            bump_generation(namespace)
+
+        invalidated.connect(concurrent_write)
+        try:
+            self.client.patch(f"{self.url}/{id}", {"name": "patched"}, format="json")
+        finally:
+            invalidated.disconnect(concurrent_write)
+        self.assertIsNone(cache.get(self.cache_key))
+
+        patch_response = self.client.patch(f"{self.url}/{id}", {"category": 999}, format="json")
+        self.assertEqual(patch_response.status_code, status.HTTP_404_NOT_FOUND)
+        patch_response = self.client.patch(f"{self.url}/{id}", {"price": "abc"}, format="json")
+        self.assertEqual(patch_response.status_code, status.HTTP_400_BAD_REQUEST)
+        patch_response = self.client.patch(f"{self.url}/999", {"name": "x"}, format="json")
+        self.assertEqual(patch_response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_delete_product_by_id(self):
         post_response = self.client.post(self.url, self.data1, format="json")
         id = post_response.data["data"]["id"]
@@ -264,5 +849,585 @@ class ProductApiTest(APITestCase):
         cache.set(self.cache_key, "test", 60*5)
         self.client.delete(f"{self.url}/{id}")
         self.assertIsNone(cache.get(self.cache_key))
-        
-        
\ No newline at end of file
+
+
+class ImportProductsCommandTest(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def import_file(self, content, suffix, *args):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix) as file:
+            file.write(content)
+            file.flush()
+            out, err = StringIO(), StringIO()
+            call_command("import_products", file.name, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_csv(self):
+        Category.objects.create(name="cat1")
+        cache.set("store:products", "test")
+        content = (
+            "name,description,price,category\n"
+            "p1,first,10.50,cat1\n"
+            "p2,,abc,cat1\n"
+            "p3,,7,cat2\n"
+        )
+        out, err = self.import_file(content, ".csv", "--batch-size", "1")
+        self.assertIn("Imported 1 products, skipped 2 rows", out)
+        self.assertIn("line 3", err)
+        self.assertIn("line 4: unknown category 'cat2'", err)
+        self.assertEqual(Product.objects.get().price, Decimal("10.50"))
+        # Caches are rebuilt once at the end
+        self.assertEqual(len(cache.get("store:products")), 1)
+
+    def test_import_jsonl_upsert(self):
+        category = Category.objects.create(name="cat1")
+        product = Product.objects.create(name="old", price=1, category=category)
+        content = "\n".join(
+            json.dumps(row)
+            for row in [
+                {"id": product.id, "name": "new", "price": "2", "category": "cat1"},
+                {"name": "p2", "price": 3, "category": "cat2"},
+                {"name": "free", "price": 0, "category": "cat1"},
+                {"name": "cheap", "price": 19.99, "category": "cat1"},
+            ]
+        )
+        self.import_file(content, ".jsonl", "--create-categories")
+        product.refresh_from_db()
+        self.assertEqual(product.name, "new")
+        self.assertEqual(Product.objects.filter(category__name="cat2").count(), 1)
+        self.assertEqual(Product.objects.get(name="free").price, 0)
+        self.assertEqual(Product.objects.get(name="cheap").price, Decimal("19.99"))
+
+
+class BenchStoreCommandTest(TestCase):
+    def test_report(self):
+        out = StringIO()
+        call_command(
+            "bench_store", "--current-database", "--categories", "2", "--products", "20",
+            "--requests", "3", "--write-ratios", "0.5", stdout=out,
+        )
+        scenarios = json.loads(out.getvalue())["scenarios"]
+        self.assertIn("products.filtered.warm", scenarios)
+        self.assertIn("mixed.write_0.5", scenarios)
+        warm = scenarios["products.list.warm"]
+        self.assertEqual(warm["queries_per_request"], 0)
+        self.assertEqual(warm["cache_hit_ratio"], 1)
+        self.assertEqual(scenarios["products.list.cold"]["latency_ms"].keys(),
+                         {"mean", "p50", "p95", "p99"})
+        for result in scenarios.values():
+            self.assertTrue(all(code < "400" for code in result["status_codes"]))
+
+    def test_tuned_sqlite_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = DatabaseWrapper(
+                {**connection.settings_dict, "NAME": f"{directory}/db.sqlite3",
+                 **settings.STORE_SQLITE_TUNED},
+                alias="tuned",
+            )
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {}
+                    for name in ("journal_mode", "synchronous", "busy_timeout"):
+                        cursor.execute(f"PRAGMA {name}")
+                        pragmas[name] = cursor.fetchone()[0]
+            finally:
+                wrapper.close()
+        self.assertEqual(pragmas, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000})
+        self.assertEqual(wrapper.transaction_mode, "IMMEDIATE")
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "store.metrics.MeteredLocMemCache"}},
+    STORE_SERVER_TIMING=True,
+)
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_metrics(self):
+        Category.objects.create(name="cat1")
+        self.client.get("/api/categories")
+        response = self.client.get("/api/categories")
+        self.assertIn('db;dur=0.000;desc="0 queries"', response["Server-Timing"])
+        self.assertIn('cache;desc="3 hits, 0 misses"', response["Server-Timing"])
+
+        body = self.client.get("/api/metrics").content.decode()
+        self.assertIn(
+            'store_requests_total{view="api/categories",method="GET",status="200"} 2.0', body
+        )
+        self.assertIn(
+            'store_request_duration_seconds_count{view="api/categories",method="GET"} 2', body
+        )
+        self.assertIn('store_db_queries_total{view="api/categories"} 1.0', body)
+        for operation in ("hit", "miss", "set"):
+            self.assertRegex(
+                body,
+                f'store_cache_operations_total{{namespace="store:categories",operation="{operation}"}} [1-9]',
+            )
+        self.assertIn('store_response_size_bytes_bucket{view="api/categories",le="+Inf"} 2', body)
+
+
+class WarmCacheTest(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_warm_cache_command(self):
+        category = Category.objects.create(name="Cat1")
+        Product.objects.create(name="p1", price=10, category=category)
+        # Recorded as a popular combination when built
+        self.client.get("/api/products?price_min=5")
+        invalidate_products()
+        out = StringIO()
+        call_command("warm_cache", stdout=out)
+        self.assertIn("Warmed 4 lists", out.getvalue())
+        with self.assertNumQueries(0):
+            for url in [
+                "/api/products",
+                "/api/categories",
+                "/api/products?category_name=cat1",
+                "/api/products?price_min=5.0",
+            ]:
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_popular_filters(self):
+        for _ in range(2):
+            warming.record_filter({"price_min": 5.0})
+        warming.record_filter({"category_name": "cat1"})
+        self.assertEqual(warming.popular_filters(1), [{"price_min": 5.0}])
+
+
+@override_settings(STORE_CACHE_REFRESH_ON_WRITE=True)
+class RefreshOnWriteTest(TransactionTestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_write_refreshes_lists(self):
+        category = Category.objects.create(name="cat1")
+        self.client.post(
+            "/api/products",
+            {"name": "p1", "price": 10, "category": category.id},
+            content_type="application/json",
+        )
+        # Wait for the refresh queued by the write
+        warming._executor.submit(lambda: None).result()
+        self.assertEqual(len(cache.get("store:products")), 1)
+        with self.assertNumQueries(0):
+            self.client.get("/api/products?category_name=cat1")
+
+
+class CategoryStatsTest(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def assertStatsCorrect(self):
+        self.assertEqual(stats.verify_category_stats(), [])
+
+    def test_stats_follow_writes(self):
+        cat1 = Category.objects.create(name="cat1")
+        cat2 = Category.objects.create(name="cat2")
+        ids = [
+            self.client.post(
+                "/api/products",
+                {"name": name, "price": price, "category": cat1.id},
+                content_type="application/json",
+            ).data["data"]["id"]
+            for name, price in [("p1", "10.00"), ("p2", "20.00"), ("p3", "60.00")]
+        ]
+        self.assertStatsCorrect()
+
+        # Price change of the maximum, then a move to another category
+        response = self.client.put(
+            f"/api/products/{ids[2]}",
+            {"name": "p3", "price": "5.00", "category": cat1.id},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertStatsCorrect()
+        self.client.put(
+            f"/api/products/{ids[0]}",
+            {"name": "p1", "price": "10.00", "category": cat2.id},
+            content_type="application/json",
+        )
+        self.assertStatsCorrect()
+        self.client.delete(f"/api/products/{ids[1]}")
+        self.assertStatsCorrect()
+        self.client.post(
+            "/api/products/bulk",
+            [{"name": "p4", "price": "7.50", "category": cat2.id}],
+            content_type="application/json",
+        )
+        self.client.put(
+            "/api/products/bulk",
+            [{"id": ids[2], "name": "p3", "price": "1.00", "category": cat2.id}],
+            content_type="application/json",
+        )
+        self.assertStatsCorrect()
+
+        response = self.client.get("/api/categories/stats")
+        self.assertEqual(
+            response.data["data"],
+            [
+                {"id": cat1.id, "name": "cat1", "product_count": 0,
+                 "min_price": None, "avg_price": None, "max_price": None},
+                {"id": cat2.id, "name": "cat2", "product_count": 3,
+                 "min_price": "1.00", "avg_price": "6.17", "max_price": "10.00"},
+            ],
+        )
+
+        self.client.delete(f"/api/categories/{cat2.id}")
+        self.assertStatsCorrect()
+        self.assertEqual(len(self.client.get("/api/categories/stats").data["data"]), 1)
+
+    def test_concurrent_updates(self):
+        cat1 = Category.objects.create(name="cat1")
+        cat2 = Category.objects.create(name="cat2")
+        cat3 = Category.objects.create(name="cat3")
+        product = Product.objects.create(name="p1", price=10, category=cat1)
+        Product.objects.create(name="p2", price=1, category=cat1)
+
+        # Two requests read the product, then save their changes in turn
+        first, second = Product.objects.get(id=product.id), Product.objects.get(id=product.id)
+        first.price, second.price = 20, 30
+        first.save()
+        second.save()
+        self.assertStatsCorrect()
+        first, second = Product.objects.get(id=product.id), Product.objects.get(id=product.id)
+        first.category, second.category = cat2, cat3
+        first.save()
+        second.save()
+        self.assertStatsCorrect()
+
+    def test_bulk_delete(self):
+        cat1 = Category.objects.create(name="cat1")
+        cat2 = Category.objects.create(name="cat2")
+        response = self.client.post(
+            "/api/products/bulk",
+            [
+                {"name": f"p{i}", "price": f"{i}.00", "category": (cat1, cat2)[i % 2].id}
+                for i in range(1, 41)
+            ],
+            content_type="application/json",
+        )
+        ids = [product["id"] for product in response.data["data"]["results"]]
+        # The stats and tombstones are updated per batch, not per product
+        with self.assertNumQueries(9):
+            response = self.client.delete(
+                "/api/products/bulk", ids[:30], content_type="application/json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Product.objects.count(), 10)
+        self.assertStatsCorrect()
+
+        # Without a stats row, deletes rebuild it once committed
+        CategoryStats.objects.filter(category=cat1).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            for product in Product.objects.filter(category=cat1):
+                product.delete()
+        self.assertStatsCorrect()
+
+    def test_stats_command(self):
+        category = Category.objects.create(name="cat1")
+        Product.objects.create(name="p1", price=10, category=category)
+        CategoryStats.objects.update(product_count=5)
+        with self.assertRaisesMessage(CommandError, f"1 categories: {category.id}"):
+            call_command("category_stats", "--verify", stdout=StringIO())
+        call_command("category_stats", stdout=StringIO())
+        self.assertStatsCorrect()
+
+
+@override_settings(STORE_CHANGES_SETTLE=0)
+class ChangesFeedTest(TestCase):
+    url = "/api/products/changes"
+
+    def setUp(self):
+        self.category = Category.objects.create(name="cat1")
+        other = Category.objects.create(name="cat2")
+        self.products = [
+            self.client.post(
+                "/api/products", {"name": f"p{i}", "price": "5", "category": category.id}
+            ).data["data"]["id"]
+            for i, category in enumerate([self.category, self.category, other])
+        ]
+
+    def tearDown(self):
+        cache.clear()
+
+    def sync(self, since=None, **params):
+        params = {**params, **({"since": since} if since else {})}
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["data"]
+
+    def test_changes(self):
+        feed = self.sync()
+        self.assertEqual([p["id"] for p in feed["changed"]], self.products)
+        self.assertEqual(feed["deleted"], [])
+        self.assertFalse(feed["has_more"])
+        # Nothing new: answered from the token and the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(self.sync(feed["next_since"])["next_since"], feed["next_since"])
+
+        id1, id2, id3 = self.products
+        self.client.patch(
+            f"/api/products/{id1}", json.dumps({"price": "6"}), content_type="application/json"
+        )
+        feed = self.sync(feed["next_since"])
+        self.assertEqual([(p["id"], p["price"]) for p in feed["changed"]], [(id1, "6.00")])
+
+        # Deletes, including the products of a deleted category
+        self.client.delete(f"/api/products/{id3}")
+        self.client.delete(f"/api/categories/{self.category.id}")
+        feed = self.sync(feed["next_since"])
+        self.assertEqual(feed["changed"], [])
+        self.assertEqual(sorted(feed["deleted"]), [id1, id2, id3])
+        self.assertEqual(self.sync(feed["next_since"])["deleted"], [])
+
+        # A bulk delete records the tombstones of the batch at once
+        other = Category.objects.get(name="cat2")
+        ids = [Product.objects.create(name=f"b{i}", price=5, category=other).id for i in range(3)]
+        feed = self.sync(feed["next_since"])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.delete("/api/products/bulk", json.dumps(ids), content_type="application/json")
+        tombstone_writes = [q for q in queries if "store_producttombstone" in q["sql"]]
+        self.assertEqual(len(tombstone_writes), 1)
+        self.assertEqual(sorted(self.sync(feed["next_since"])["deleted"]), ids)
+
+    def test_paging(self):
+        feed = self.sync(limit=2)
+        self.assertEqual([p["id"] for p in feed["changed"]], self.products[:2])
+        self.assertTrue(feed["has_more"])
+        feed = self.sync(feed["next_since"], limit=2)
+        self.assertEqual([p["id"] for p in feed["changed"]], self.products[2:])
+        self.assertFalse(feed["has_more"])
+
+    def test_invalid_and_expired_tokens(self):
+        response = self.client.get(self.url, {"since": "not-a-token"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        old = timezone.now() - timezone.timedelta(days=31)
+        response = self.client.get(self.url, {"since": changes.encode_token((old, None), (old, None))})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+    def test_prune_tombstones(self):
+        self.client.delete(f"/api/products/{self.products[0]}")
+        ProductTombstone.objects.create(
+            product_id=999, deleted_at=timezone.now() - timezone.timedelta(days=31)
+        )
+        out = StringIO()
+        call_command("prune_tombstones", stdout=out)
+        self.assertIn("Pruned 1 tombstones", out.getvalue())
+        self.assertEqual(
+            list(ProductTombstone.objects.values_list("product_id", flat=True)),
+            [self.products[0]],
+        )
+
+
+@override_settings(STORE_READ_REPLICAS=["replica1", "replica2"], STORE_REPLICA_LAG=60)
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = replicas.ReplicaRouter()
+
+    def tearDown(self):
+        cache.clear()
+
+    def route(self, request):
+        """Return the database the request's reads go to, and its response."""
+        databases = []
+
+        def view(request):
+            databases.append(self.router.db_for_read(Product))
+            return HttpResponse()
+
+        response = replicas.ReplicaMiddleware(view)(request)
+        return databases[0], response
+
+    def test_routing(self):
+        database, response = self.route(self.factory.get("/api/products"))
+        self.assertIn(database, ["replica1", "replica2"])
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+        with filling():
+            self.assertIn(self.route(self.factory.get("/api/products"))[0], ["replica1", "replica2"])
+        # Outside requests everything uses the default database
+        self.assertIsNone(self.router.db_for_read(Product))
+        self.assertIs(self.router.allow_migrate("replica1", "store"), False)
+
+        # Writes pin the client to the primary
+        database, response = self.route(self.factory.post("/api/products"))
+        self.assertIsNone(database)
+        self.assertEqual(response.cookies[replicas.PIN_COOKIE]["max-age"], 10)
+        request = self.factory.get("/api/products")
+        request.COOKIES[replicas.PIN_COOKIE] = "1"
+        self.assertIsNone(self.route(request)[0])
+
+        # Until replicas can have caught up, other clients fill caches from
+        # the primary, and only that
+        invalidate_products()
+        database, _ = self.route(self.factory.get("/api/products"))
+        self.assertIn(database, ["replica1", "replica2"])
+        with filling():
+            self.assertEqual(self.route(self.factory.get("/api/products"))[0], "default")
+
+
+class RenderersTest(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_orjson_renderer_matches_json_renderer(self):
+        data = {
+            "data": [{
+                "price": Decimal("10.50"),
+                "update_at": datetime(2024, 5, 1, 12, 30, 15, 250000, tzinfo=dt_timezone.utc),
+                "name": "line\u2028break \u00e9",
+                1: None,
+            }],
+            "message": "Success",
+        }
+        self.assertEqual(renderers.ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            renderers.ORJSONRenderer().render(data, "application/json; indent=2"),
+            JSONRenderer().render(data, "application/json; indent=2"),
+        )
+
+    def test_accepted_encoding(self):
+        factory = RequestFactory()
+        for header, expected in [
+            ("", None),
+            ("gzip, deflate", "gzip"),
+            ("GZIP;q=0.5", "gzip"),
+            ("gzip;q=0", None),
+            ("*", compression.ENCODINGS[0]),
+            ("deflate", None),
+        ]:
+            request = factory.get("/", HTTP_ACCEPT_ENCODING=header)
+            self.assertEqual(compression.accepted_encoding(request), expected, header)
+
+    @skipUnless(renderers.msgpack, "msgpack is not installed")
+    def test_msgpack(self):
+        Category.objects.create(name="cat1")
+        response = self.client.get("/api/categories", HTTP_ACCEPT=renderers.MSGPACK)
+        self.assertEqual(response["Content-Type"], renderers.MSGPACK)
+        body = renderers.msgpack.unpackb(response.content)
+        self.assertEqual(body, json.loads(self.client.get("/api/categories").content))
+
+
+class ValuesSerializerTest(TestCase):
+    def setUp(self):
+        category1 = Category.objects.create(name="Catégorie 1", description="Déjà vu")
+        category2 = Category.objects.create(name="Category 2")
+        prices = ["0", "0.1", "5", "10.25", "99999999.99"]
+        for i, price in enumerate(prices):
+            Product.objects.create(
+                name=f"Product {i} ✓",
+                description=None if i % 2 else 'with "quotes"\n',
+                price=Decimal(price),
+                category=category1 if i % 2 else category2,
+            )
+
+    def tearDown(self):
+        cache.clear()
+
+    def assertSameOutput(self, serializer_class, rows_serializer, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        actual = JSONRenderer().render(rows_serializer.serialize(queryset))
+        self.assertEqual(actual, expected)
+
+    def test_product_rows(self):
+        self.assertSameOutput(ProductSerializer, product_rows, Product.objects.all())
+        self.assertSameOutput(
+            ProductSerializer, product_rows, Product.objects.filter(price__gte=5)
+        )
+
+    def test_product_rows_in_other_timezone(self):
+        with timezone.override("Asia/Jakarta"):
+            self.assertSameOutput(ProductSerializer, product_rows, Product.objects.all())
+
+    def test_category_rows(self):
+        self.assertSameOutput(CategorySerializer, category_rows, Category.objects.all())
+
+    def test_list_endpoint_output_unchanged(self):
+        expected = ProductSerializer(Product.objects.all(), many=True).data
+        response = self.client.get("/api/products")
+        self.assertEqual(
+            JSONRenderer().render(response.data["data"]), JSONRenderer().render(expected)
+        )
+
+
+class QueryPlanTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Cat1")
+        Product.objects.create(name="p1", price=10, category=self.category)
+
+    def assertUsesIndex(self, queryset, index):
+        self.assertIn(index, queryset.explain())
+
+    def test_filter_by_category_and_price(self):
+        queryset = filter_products({"category_name": "cat1", "price_min": 5.0, "price_max": 20.0})
+        self.assertUsesIndex(queryset, "product_category_price_idx")
+
+    def test_filter_by_price(self):
+        self.assertUsesIndex(filter_products({"price_min": 5.0}), "product_price_idx")
+        self.assertUsesIndex(
+            filter_products({"price_max": 20.0}).order_by("price", "id"), "product_price_idx"
+        )
+
+    def test_changed_since(self):
+        queryset = Product.objects.filter(update_at__gt=timezone.now()).order_by("update_at")
+        self.assertUsesIndex(queryset, "product_update_at_idx")
+
+    def test_category_name_lookup(self):
+        queryset = categories_named("CAT1").values_list("id", flat=True)
+        self.assertEqual(queryset.first(), self.category.id)
+        self.assertUsesIndex(queryset.order_by("id")[:1], "category_name_lower_idx")
+
+
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        self.category = Category.objects.create(name="cat1", description="cat1")
+        self.product = Product.objects.create(
+            name="test1", description="test", price="10.00", category=self.category
+        )
+        Product.objects.create(name="test2", price="25", category=self.category)
+
+    def tearDown(self):
+        cache.clear()
+
+    async def assertSameAsSync(self, view, url, **kwargs):
+        response = await view(self.factory.get(url), **kwargs)
+        await cache.aclear()
+        expected = await self.async_client.get(url)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(json.loads(response.content), json.loads(expected.content))
+        return response
+
+    async def test_reads_match_sync_views(self):
+        await self.assertSameAsSync(async_views.products_view, "/api/products")
+        await self.assertSameAsSync(async_views.products_view, "/api/products?price_min=20")
+        await self.assertSameAsSync(async_views.products_view, "/api/products?category_name=x")
+        await self.assertSameAsSync(
+            async_views.product_by_id_view, f"/api/products/{self.product.id}", id=self.product.id
+        )
+        await self.assertSameAsSync(async_views.product_by_id_view, "/api/products/999", id=999)
+        await self.assertSameAsSync(async_views.categories_view, "/api/categories")
+        await self.assertSameAsSync(
+            async_views.category_by_id_view,
+            f"/api/categories/{self.category.id}",
+            id=self.category.id,
+        )
+
+    async def test_conditional_get(self):
+        response = await async_views.products_view(self.factory.get("/api/products"))
+        request = self.factory.get("/api/products", headers={"If-None-Match": response["ETag"]})
+        response = await async_views.products_view(request)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_writes_use_sync_views(self):
+        request = self.factory.post(
+            "/api/categories", {"name": "cat2"}, content_type="application/json"
+        )
+        response = await async_views.categories_view(request)
+        response.render()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(await Category.objects.acount(), 2)
+
@@ -1,11 +1,23 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Views serving GET on the main product and category routes
+read_views = async_views if getattr(settings, "STORE_ASYNC_READS", False) else views
 
 urlpatterns = [
     path("", views.ApiOverview),
-    path("categories", views.categories_view),
-    path("categories/<int:id>", views.category_by_id_view),
-    path("products", views.products_view),
-    path("products/<int:id>", views.product_by_id_view),
+    path("metrics", views.metrics_view),
+    path("categories", read_views.categories_view),
+    path("categories/bulk", views.categories_bulk_view),
+    path("categories/stats", views.category_stats_view),
+    path("categories/<int:id>", read_views.category_by_id_view),
+    path("products", read_views.products_view),
+    path("products/bulk", views.products_bulk_view),
+    path("products/changes", views.products_changes_view),
+    path("products/export", views.products_export_view),
+    path("products/facets", views.products_facets_view),
+    path("products/search", views.products_search_view),
+    path("products/<int:id>", read_views.product_by_id_view),
 ]
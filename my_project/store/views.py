@@ -1,9 +1,79 @@
+import csv
+import json
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_GET
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
 from rest_framework import status
+from . import metrics
+from .compression import accepted_encoding
 from .models import Product, Category
-from .serializers import ProductSerializer, CategorySerializer
+from .serializers import (
+    CategoryBulkSerializer,
+    CategorySerializer,
+    CategoryStatsSerializer,
+    ProductBulkSerializer,
+    ProductSerializer,
+    category_rows,
+    product_rows,
+)
+from .changes import (
+    DEFAULT_CHANGES_LIMIT,
+    MAX_CHANGES_LIMIT,
+    ExpiredToken,
+    InvalidToken,
+    product_changes,
+    record_deleted,
+)
+from .cache import (
+    BODY_SUFFIXES,
+    CATEGORIES_KEY,
+    DETAIL_TIMEOUT,
+    LIST_TIMEOUT,
+    PRODUCTS_KEY,
+    category_key,
+    filling,
+    get_many_or_load,
+    get_or_load,
+    get_or_rebuild_stale,
+    invalidate_categories,
+    invalidate_products,
+    patch_list,
+    product_key,
+    versioned_key,
+)
+from .conditional import (
+    category_validators,
+    conditional_response,
+    if_match,
+    list_validators,
+    make_etag,
+    not_modified,
+    product_validators,
+    set_validators,
+)
+from .facets import price_buckets, product_facets
+from .filters import filter_key, filter_products, product_filters
+from .stats import category_stats, product_saved, product_saving, rebuild_category_stats
+from .search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, fts_query, search_products
+from .lists import category_list, product_list, render_body
+from .pagination import (
+    CATEGORY_ORDERINGS,
+    PRODUCT_ORDERINGS,
+    InvalidPage,
+    is_paginated,
+    keyset_page,
+    parse_page_params,
+)
+from .warming import record_filter
 from django.core.cache import cache
 
 
@@ -11,35 +81,155 @@ def response_wrapper(data=None, message=None, status_code=status.HTTP_200_OK):
     return Response({"data": data, "message": message}, status=status_code)
 
 
+def serialize_first(queryset, serializer_class):
+    obj = queryset.first()
+    return None if obj is None else serializer_class(obj).data
+
+
+def body_encoding(request):
+    """Content encoding of the cached response body served to ``request``."""
+    if getattr(settings, "STORE_CACHE_COMPRESS", False):
+        return accepted_encoding(request)
+    return None
+
+
+def body_response(request, body, encoding=None):
+    response = HttpResponse(body, content_type="application/json")
+    if encoding:
+        response["Content-Encoding"] = encoding
+    patch_vary_headers(response, ["Accept", "Accept-Encoding"])
+    return response
+
+
+def cached_response(request, key, build, namespace, single_flight=False):
+    """Respond with the list data built by ``build``, cached under ``key``.
+
+    ``namespace`` is the cache namespace the list belongs to; it supplies the
+    ETag and Last-Modified validators, so conditional requests get a 304
+    before anything is read or built. ``single_flight`` marks a hot list that
+    is rebuilt by one worker at a time (see ``get_or_rebuild``). With
+    ``STORE_CACHE_RENDERED`` on, JSON clients get the cached response body as
+    is, skipping unpickling and rendering; with ``STORE_CACHE_COMPRESS`` too,
+    each content encoding clients accept has its own compressed body.
+    """
+    rendered = getattr(settings, "STORE_CACHE_RENDERED", False) and isinstance(
+        request.accepted_renderer, JSONRenderer
+    )
+    encoding = body_encoding(request) if rendered else None
+    etag, modified = list_validators(
+        request.accepted_media_type, key, namespace, encoding or ""
+    )
+    response = not_modified(request, etag, modified)
+    if response is None:
+        if rendered:
+            body_key = key + BODY_SUFFIXES[encoding]
+            load = lambda: render_body(build(), encoding)
+        else:
+            body_key, load = key, build
+        stale = False
+        if single_flight:
+            data, stale = get_or_rebuild_stale(body_key, load, namespace=namespace)
+        else:
+            with filling():
+                data = cache.get_or_set(body_key, load, timeout=LIST_TIMEOUT)
+        if rendered:
+            response = body_response(request, data, encoding)
+        else:
+            response = response_wrapper(data=data, message="Success")
+        if stale:
+            return stale_response(response)
+    return set_validators(response, etag, modified)
+
+
+def stale_response(response):
+    """Mark a response serving a stale copy of a list as not to be stored.
+
+    Its validators would be those of the current generation, so a client
+    revalidating it after the rebuild would keep the stale copy.
+    """
+    patch_cache_control(response, no_store=True)
+    return response
+
+
+def paginated_response(request, get_queryset, rows_serializer, orderings, cache_scope):
+    try:
+        ordering, limit, after = parse_page_params(request.query_params, orderings)
+    except InvalidPage:
+        return response_wrapper(
+            message="Invalid pagination values",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    def build():
+        # The cursor needs the sort key even when the fields leave it out
+        queryset = rows_serializer.values(get_queryset(), *orderings[ordering])
+        rows, next_cursor = keyset_page(queryset, ordering, orderings, limit, after)
+        results = [rows_serializer.to_representation(row) for row in rows]
+        return {"results": results, "next_cursor": next_cursor}
+
+    cursor = request.query_params.get("cursor", "")
+    key = versioned_key(*cache_scope, "page", ordering, limit, cursor)
+    return cached_response(request, key, build, cache_scope[0])
+
+
 @api_view(["GET"])
 def ApiOverview(request):
     api_urls = {
         "List all categories": "/api/categories/",
+        "List categories page by page": "/api/categories/?limit=&cursor=",
         "Create a new category": "/api/categories/",
         "Retrieve a category by id": "/api/categories/{id}",
         "Update a category by id": "/api/categories/{id}",
         "Delete a category by id": "/api/categories/{id}",
         "List all products": "/api/products/",
+        "List some fields of products, with their category embedded": "/api/products/?fields=id,name,price&expand=category",
+        "List products page by page": "/api/products/?limit=&cursor=&ordering=id|price",
         "Create a new product": "/api/products/",
+        "Retrieve products by id, reporting the missing ones": "/api/products/?ids=1,2,3&fields=&expand=category",
         "Retrieve a product by id": "/api/products/{id}?category_name=&price_min=&price_max&",
+        "Retrieve some fields of a product, with its category embedded": "/api/products/{id}?fields=id,name&expand=category",
         "Update a product by id": "/api/products/{id}",
+        "Update some fields of a product (If-Match supported)": "/api/products/{id}",
         "Delete a product by id": "/api/products/{id}",
+        "Product count and min/avg/max price of every category": "/api/categories/stats",
+        "Create, update or delete categories in bulk": "/api/categories/bulk",
+        "Create, update or delete products in bulk": "/api/products/bulk",
+        "Search products by name or description": "/api/products/search?q=&limit=&category_name=&price_min=&price_max=",
+        "Product counts by category and price bucket": "/api/products/facets?price_buckets=10,25,50&category_name=&price_min=&price_max=",
+        "Products changed or deleted since a token from the previous call": "/api/products/changes?since=&limit=",
+        "Stream all products": "/api/products/export?format=ndjson|csv&category_name=&price_min=&price_max=",
+        "Request metrics in the Prometheus format": "/api/metrics",
     }
     return response_wrapper(data=api_urls, message="List of API URL")
 
 
+@api_view(["GET"])
+def category_stats_view(request):
+    return response_wrapper(
+        data=CategoryStatsSerializer(category_stats(), many=True).data, message="Success"
+    )
+
+
 @api_view(["GET", "POST"])
 def categories_view(request):
 
     # Get all category data
     if request.method == "GET":
-        data = cache.get("store:categories")
-        if not data:
-            categories = Category.objects.all()
-            serializer = CategorySerializer(categories, many=True)
-            data = serializer.data
-            cache.set(key="store:categories", value=data, timeout=5 * 60)
-        return response_wrapper(data=data, message="Success")
+        if is_paginated(request.query_params):
+            return paginated_response(
+                request,
+                Category.objects.all,
+                category_rows,
+                CATEGORY_ORDERINGS,
+                cache_scope=(CATEGORIES_KEY,),
+            )
+        return cached_response(
+            request,
+            CATEGORIES_KEY,
+            category_list,
+            CATEGORIES_KEY,
+            single_flight=True,
+        )
 
     # Post a new category
     elif request.method == "POST":
@@ -52,7 +242,9 @@ def categories_view(request):
             )
         if serializer.is_valid():
             serializer.save()
-            cache.delete(key="store:categories")
+            # The new id may still hold a negative cache entry
+            cache.delete(key=category_key(serializer.data["id"]))
+            invalidate_categories()
             return response_wrapper(
                 data=serializer.data,
                 message="Success",
@@ -71,15 +263,19 @@ def category_by_id_view(request, *args, **kwargs):
 
     # Get category by ID
     if request.method == "GET":
-        try:
-            category = Category.objects.get(id=id)
-        except Category.DoesNotExist:
+        data = get_or_load(
+            category_key(id),
+            lambda: serialize_first(Category.objects.filter(id=id), CategorySerializer),
+        )
+        if data is None:
             return response_wrapper(
                 message=f"Category with id {id} not found",
                 status_code=status.HTTP_404_NOT_FOUND,
             )
-        serializer = CategorySerializer(category)
-        return response_wrapper(data=serializer.data, message="Success")
+        etag, modified = category_validators(request.accepted_media_type, data)
+        return conditional_response(
+            request, etag, modified, lambda: response_wrapper(data=data, message="Success")
+        )
 
     # Update category by ID
     elif request.method == "PUT":
@@ -93,7 +289,10 @@ def category_by_id_view(request, *args, **kwargs):
         serializer = CategorySerializer(instance=category, data=request.data)
         if serializer.is_valid():
             serializer.save()
-            cache.delete(key="store:categories")
+            cache.set(key=category_key(id), value=serializer.data, timeout=DETAIL_TIMEOUT)
+            invalidate_categories()
+            # Cached product filters resolved the old category name
+            invalidate_products()
             return response_wrapper(data=serializer.data, message="Success")
         else:
             return response_wrapper(
@@ -111,8 +310,12 @@ def category_by_id_view(request, *args, **kwargs):
                 message=f"Category with id {id} not found",
                 status_code=status.HTTP_404_NOT_FOUND,
             )
+        product_ids = list(category.products.values_list("id", flat=True))
         category.delete()
-        cache.delete(key="store:categories")
+        cache.delete_many([category_key(id)] + [product_key(pk) for pk in product_ids])
+        invalidate_categories()
+        # The delete cascades to the category's products
+        invalidate_products()
         return response_wrapper(
             message=f"Category with id {id} has been deleted successfully",
             status_code=status.HTTP_204_NO_CONTENT,
@@ -123,42 +326,59 @@ def category_by_id_view(request, *args, **kwargs):
 def products_view(request, *args, **kwargs):
     # Get all product
     if request.method == "GET":
-        if not request.query_params:
-            data = cache.get(key="store:products")
-            if not data:
-                products = Product.objects.all()
-                serializer = ProductSerializer(products, many=True)
-                data = serializer.data
-                cache.set(key="store:products", value=data, timeout=5 * 60)
-        else:
-            filters = {}
-            category_name = request.query_params.get("category_name")
-            price_min = request.query_params.get("price_min")
-            price_max = request.query_params.get("price_max")
-            try:
-                if price_min:
-                    filters["price__gte"] = float(price_min)
-                if price_max:
-                    filters["price__lte"] = float(price_max)
-            except ValueError:
-                return response_wrapper(
-                    message="Invalid price filter values",
-                    status_code=status.HTTP_400_BAD_REQUEST,
+        try:
+            filters = product_filters(request.query_params)
+        except ValueError:
+            return response_wrapper(
+                message="Invalid price filter values",
+                status_code=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            rows = product_rows.select_params(request.query_params)
+        except ValueError as e:
+            return response_wrapper(message=str(e), status_code=status.HTTP_400_BAD_REQUEST)
+        if "ids" in request.query_params:
+            return products_batch_response(request.query_params["ids"], rows)
+        try:
+            if is_paginated(request.query_params):
+                return paginated_response(
+                    request,
+                    lambda: filter_products(filters),
+                    rows,
+                    PRODUCT_ORDERINGS,
+                    cache_scope=(PRODUCTS_KEY, "filter", filter_key(filters), rows.key),
+                )
+            if rows is not product_rows:
+                return cached_response(
+                    request,
+                    versioned_key(PRODUCTS_KEY, "filter", filter_key(filters), rows.key),
+                    lambda: rows.serialize(filter_products(filters)),
+                    PRODUCTS_KEY,
+                )
+            if not filters:
+                return cached_response(
+                    request,
+                    PRODUCTS_KEY,
+                    product_list,
+                    PRODUCTS_KEY,
+                    single_flight=True,
                 )
-            if category_name:
-                try:
-                    category = Category.objects.get(name__icontains=category_name)
-                    filters["category_id"] = category.id
-                except Category.DoesNotExist:
-                    return response_wrapper(
-                        message=f"Category with name '{category_name}' not found",
-                        status_code=status.HTTP_404_NOT_FOUND,
-                    )
-            products = Product.objects.filter(**filters)
-            serializer = ProductSerializer(products, many=True)
-            data = serializer.data     
-        return response_wrapper(data=data, message="Success")
-            
+
+            def build():
+                record_filter(filters)
+                return product_rows.serialize(filter_products(filters))
+
+            return cached_response(
+                request,
+                versioned_key(PRODUCTS_KEY, "filter", filter_key(filters)),
+                build,
+                PRODUCTS_KEY,
+            )
+        except Category.DoesNotExist:
+            return response_wrapper(
+                message=f"Category with name '{request.query_params['category_name']}' not found",
+                status_code=status.HTTP_404_NOT_FOUND,
+            )
 
     # Post a new product
     elif request.method == "POST":
@@ -178,7 +398,9 @@ def products_view(request, *args, **kwargs):
         serializer = ProductSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save()
-            cache.delete(key="store:products")
+            # The new id may still hold a negative cache entry
+            cache.delete(key=product_key(serializer.data["id"]))
+            invalidate_products()
             return response_wrapper(
                 data=serializer.data,
                 message="Success",
@@ -191,21 +413,125 @@ def products_view(request, *args, **kwargs):
         )
 
 
-@api_view(["GET", "PUT", "DELETE"])
+def patch_product(request, id):
+    """Update the fields present in the request body, and only those.
+
+    The product and the existence of a new category are read in one query.
+    The UPDATE is conditional on ``update_at`` when the request carries
+    If-Match, so a concurrent write between the check and the UPDATE turns
+    into a 412 instead of being overwritten.
+    """
+    serializer = ProductBulkSerializer(data=request.data, partial=True)
+    if not serializer.is_valid():
+        return response_wrapper(
+            data=serializer.errors,
+            message="Validation Error",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+    changes = serializer.validated_data
+    products = Product.objects.filter(id=id)
+    if "category_id" in changes:
+        products = products.annotate(
+            category_exists=Exists(Category.objects.filter(id=changes["category_id"]))
+        )
+    product = products.first()
+    if product is None:
+        return response_wrapper(
+            message=f"Product with id {id} not found",
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+    if not getattr(product, "category_exists", True):
+        return response_wrapper(
+            message=f"Category with id {changes['category_id']} does not exist",
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+    data = ProductSerializer(product).data
+    etag, modified = product_validators(request.accepted_media_type, data)
+    if not if_match(request, etag):
+        return set_validators(
+            response_wrapper(
+                message=f"Product with id {id} was modified",
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+            ),
+            etag,
+            modified,
+        )
+    changes = {
+        attr: value for attr, value in changes.items() if getattr(product, attr) != value
+    }
+    if changes:
+        guard = {"update_at": product.update_at} if "If-Match" in request.headers else {}
+        changes["update_at"] = timezone.now()
+        with transaction.atomic():
+            # update() sends no signals
+            product_saving(Product, product)
+            updated = Product.objects.filter(id=id, **guard).update(**changes)
+            if updated:
+                for attr, value in changes.items():
+                    setattr(product, attr, value)
+                product_saved(Product, product, created=False)
+        if not updated:
+            if guard:
+                return response_wrapper(
+                    message=f"Product with id {id} was modified",
+                    status_code=status.HTTP_412_PRECONDITION_FAILED,
+                )
+            return response_wrapper(
+                message=f"Product with id {id} not found",
+                status_code=status.HTTP_404_NOT_FOUND,
+            )
+        data = ProductSerializer(product).data
+        cache.set(key=product_key(id), value=data, timeout=DETAIL_TIMEOUT)
+        patch_list(PRODUCTS_KEY, data)
+        etag, modified = product_validators(request.accepted_media_type, data)
+    return set_validators(response_wrapper(data=data, message="Success"), etag, modified)
+
+
+def select_product(rows, data, etag, modified):
+    """Narrow cached product ``data`` to ``rows``, and adjust its validators.
+
+    The detail is built from the product and category caches rather than a
+    join, so it stays free of queries once both are cached. An embedded
+    category changes without the product's ``update_at``, so the ETag then
+    hashes it too and Last-Modified is dropped.
+    """
+    selected = rows.project(data)
+    if "category" in rows.expanded:
+        id = data["category"]
+        category = get_or_load(
+            category_key(id),
+            lambda: serialize_first(Category.objects.filter(id=id), CategorySerializer),
+        )
+        selected["category"] = category
+        etag, modified = make_etag(etag, json.dumps(category, sort_keys=True)), None
+    return selected, etag, modified
+
+
+@api_view(["GET", "PUT", "PATCH", "DELETE"])
 def product_by_id_view(request, *args, **kwargs):
     id = kwargs.get("id")
 
     # Get category by ID
     if request.method == "GET":
         try:
-            product = Product.objects.get(id=id)
-        except Product.DoesNotExist:
+            rows = product_rows.select_params(request.query_params)
+        except ValueError as e:
+            return response_wrapper(message=str(e), status_code=status.HTTP_400_BAD_REQUEST)
+        data = get_or_load(
+            product_key(id),
+            lambda: serialize_first(Product.objects.filter(id=id), ProductSerializer),
+        )
+        if data is None:
             return response_wrapper(
                 message=f"Product with id {id} not found",
                 status_code=status.HTTP_404_NOT_FOUND,
             )
-        serializer = ProductSerializer(product)
-        return response_wrapper(data=serializer.data, message="Success")
+        etag, modified = product_validators(request.accepted_media_type, data, rows.key)
+        if rows is not product_rows:
+            data, etag, modified = select_product(rows, data, etag, modified)
+        return conditional_response(
+            request, etag, modified, lambda: response_wrapper(data=data, message="Success")
+        )
 
     # Update category by ID
     elif request.method == "PUT":
@@ -232,7 +558,8 @@ def product_by_id_view(request, *args, **kwargs):
         serializer = ProductSerializer(instance=product, data=request.data)
         if serializer.is_valid():
             serializer.save()
-            cache.delete(key="store:products")
+            cache.set(key=product_key(id), value=serializer.data, timeout=DETAIL_TIMEOUT)
+            invalidate_products()
             return response_wrapper(data=serializer.data, message="Success")
         else:
             return response_wrapper(
@@ -241,6 +568,9 @@ def product_by_id_view(request, *args, **kwargs):
                 status_code=status.HTTP_400_BAD_REQUEST,
             )
 
+    elif request.method == "PATCH":
+        return patch_product(request, id)
+
     # Delete Category by ID
     elif request.method == "DELETE":
         try:
@@ -251,8 +581,486 @@ def product_by_id_view(request, *args, **kwargs):
                 status_code=status.HTTP_404_NOT_FOUND,
             )
         product.delete()
-        cache.delete(key="store:products")
+        cache.delete(key=product_key(id))
+        invalidate_products()
         return response_wrapper(
             message=f"Product with id {id} has been deleted successfully",
             status_code=status.HTTP_204_NO_CONTENT,
         )
+
+
+@api_view(["GET"])
+def products_facets_view(request):
+    try:
+        filters = product_filters(request.query_params)
+        edges = price_buckets(request.query_params)
+    except ValueError:
+        return response_wrapper(
+            message="Invalid filter or price bucket values",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        # Cached next to the filtered lists, in the same generation
+        return cached_response(
+            request,
+            versioned_key(
+                PRODUCTS_KEY, "facets", filter_key(filters), ",".join(map(str, edges))
+            ),
+            lambda: product_facets(filters, edges),
+            PRODUCTS_KEY,
+        )
+    except Category.DoesNotExist:
+        return response_wrapper(
+            message=f"Category with name '{request.query_params['category_name']}' not found",
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+
+
+@api_view(["GET"])
+def products_changes_view(request):
+    try:
+        limit = int(request.query_params.get("limit") or DEFAULT_CHANGES_LIMIT)
+    except ValueError:
+        return response_wrapper(
+            message="Invalid limit", status_code=status.HTTP_400_BAD_REQUEST
+        )
+    limit = max(1, min(limit, MAX_CHANGES_LIMIT))
+    try:
+        data = product_changes(request.query_params.get("since"), limit)
+    except InvalidToken:
+        return response_wrapper(
+            message="Invalid since token", status_code=status.HTTP_400_BAD_REQUEST
+        )
+    except ExpiredToken:
+        return response_wrapper(
+            message="The since token has expired, sync again without one",
+            status_code=status.HTTP_410_GONE,
+        )
+    return response_wrapper(data=data, message="Success")
+
+
+@api_view(["GET"])
+def products_search_view(request):
+    match = fts_query(request.query_params.get("q"))
+    if match is None:
+        return response_wrapper(
+            message="Search query is required",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        filters = product_filters(request.query_params)
+        limit = int(request.query_params.get("limit") or DEFAULT_SEARCH_LIMIT)
+    except ValueError:
+        return response_wrapper(
+            message="Invalid search values",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    try:
+        return cached_response(
+            request,
+            versioned_key(PRODUCTS_KEY, "search", filter_key({**filters, "q": match}), limit),
+            lambda: product_rows.serialize(search_products(match, filters)[:limit]),
+            PRODUCTS_KEY,
+        )
+    except Category.DoesNotExist:
+        return response_wrapper(
+            message=f"Category with name '{request.query_params['category_name']}' not found",
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+
+
+BULK_MAX_ITEMS = 1000
+
+
+def as_id(value):
+    """Return ``value`` as an id, or ``None`` if it is not an integer in the
+    range of SQLite integers.
+    """
+    try:
+        id = int(value)
+    except (TypeError, ValueError):
+        return None
+    return id if -2**63 <= id < 2**63 else None
+
+
+def parse_ids(value):
+    """Return the distinct ids of a comma-separated list, in order.
+
+    Raises ``ValueError`` unless there are 1 to ``BULK_MAX_ITEMS``, all in
+    the range of SQLite integers.
+    """
+    ids = list(dict.fromkeys(int(part) for part in value.split(",")))
+    if not 0 < len(ids) <= BULK_MAX_ITEMS:
+        raise ValueError
+    if not all(-2**63 <= id < 2**63 for id in ids):
+        raise ValueError
+    return ids
+
+
+def load_products(ids):
+    return {
+        id: ProductSerializer(product).data
+        for id, product in Product.objects.in_bulk(ids).items()
+    }
+
+
+def load_categories(ids):
+    return {
+        id: CategorySerializer(category).data
+        for id, category in Category.objects.in_bulk(ids).items()
+    }
+
+
+def products_batch_response(value, rows):
+    """Respond with the products of ``?ids=``, in order, and the missing ids.
+
+    Replaces one detail request per product: the cached products are read
+    with one ``get_many``, the others with one ``in_bulk`` query, and both
+    share the detail cache entries.
+    """
+    try:
+        ids = parse_ids(value)
+    except ValueError:
+        return response_wrapper(
+            message=f"Expected 1 to {BULK_MAX_ITEMS} comma-separated product ids",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+    found = get_many_or_load(ids, product_key, load_products)
+    products = [found[id] for id in ids if id in found]
+    if rows is not product_rows:
+        selected = [rows.project(data) for data in products]
+        if "category" in rows.expanded:
+            categories = get_many_or_load(
+                list(dict.fromkeys(data["category"] for data in products)),
+                category_key,
+                load_categories,
+            )
+            for item, data in zip(selected, products):
+                item["category"] = categories.get(data["category"])
+        products = selected
+    return response_wrapper(
+        data={"results": products, "missing": [id for id in ids if id not in found]},
+        message="Success",
+    )
+
+
+def bulk_response(results, errors, success_status=status.HTTP_200_OK):
+    data = {"results": results, "errors": errors}
+    if not errors:
+        return response_wrapper(data=data, message="Success", status_code=success_status)
+    if not results:
+        return response_wrapper(
+            data=data,
+            message="Validation Error",
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+    return response_wrapper(
+        data=data,
+        message="Some items failed",
+        status_code=status.HTTP_207_MULTI_STATUS,
+    )
+
+
+def bulk_write(
+    request, model, write_serializer, read_serializer, check_batch, update_fields, on_write=None
+):
+    """Validate and write a batch of POST (create) or PUT (update) items.
+
+    Items are validated one by one, then ``check_batch`` runs the checks that
+    need the database for the whole batch and returns the errors of the items
+    that failed them. Valid items are written with one ``bulk_create`` or
+    ``bulk_update`` in a single transaction, in which ``on_write`` is then
+    called with the written objects. Returns ``(objs, errors)``.
+    """
+    instances = {}
+    if request.method == "PUT":
+        ids = [as_id(item.get("id")) for item in request.data if isinstance(item, dict)]
+        instances = model.objects.in_bulk([id for id in ids if id is not None])
+
+    valid, errors = [], []
+    for index, item in enumerate(request.data):
+        instance = None
+        if request.method == "PUT":
+            id = item.get("id") if isinstance(item, dict) else None
+            instance = instances.get(as_id(id))
+            if instance is None:
+                errors.append(
+                    {"index": index, "errors": {"id": [f"{model.__name__} with id {id} not found"]}}
+                )
+                continue
+        serializer = write_serializer(instance=instance, data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer))
+        else:
+            errors.append({"index": index, "errors": serializer.errors})
+
+    failed = check_batch(valid)
+    errors.extend(failed)
+    failed_indexes = {error["index"] for error in failed}
+    objs = []
+    for index, serializer in valid:
+        if index in failed_indexes:
+            continue
+        obj = serializer.instance or model()
+        for attr, value in serializer.validated_data.items():
+            setattr(obj, attr, value)
+        objs.append(obj)
+
+    if objs:
+        with transaction.atomic():
+            if request.method == "POST":
+                model.objects.bulk_create(objs)
+            else:
+                # bulk_update() skips auto_now fields
+                if "update_at" in update_fields:
+                    now = timezone.now()
+                    for obj in objs:
+                        obj.update_at = now
+                model.objects.bulk_update(objs, update_fields)
+            if on_write:
+                on_write(objs)
+    errors.sort(key=lambda error: error["index"])
+    return read_serializer(objs, many=True).data, errors
+
+
+def bulk_delete(request, model, delete=None):
+    """Delete the ids listed in the request body. Returns ``(ids, errors)``.
+
+    ``delete``, called in the transaction with the existing ids, replaces
+    the queryset delete.
+    """
+    ids = {}
+    errors = []
+    for index, value in enumerate(request.data):
+        id = as_id(value)
+        if id is None:
+            errors.append({"index": index, "errors": {"id": ["A valid integer is required."]}})
+        else:
+            ids[id] = index
+    existing = set(model.objects.filter(id__in=ids).values_list("id", flat=True))
+    for id, index in ids.items():
+        if id not in existing:
+            errors.append(
+                {"index": index, "errors": {"id": [f"{model.__name__} with id {id} not found"]}}
+            )
+    if existing:
+        with transaction.atomic():
+            if delete:
+                delete(existing)
+            else:
+                model.objects.filter(id__in=existing).delete()
+    errors.sort(key=lambda error: error["index"])
+    return sorted(existing), errors
+
+
+def check_bulk_items(request):
+    if isinstance(request.data, list) and 0 < len(request.data) <= BULK_MAX_ITEMS:
+        return None
+    return response_wrapper(
+        message=f"Expected a list of 1 to {BULK_MAX_ITEMS} items",
+        status_code=status.HTTP_400_BAD_REQUEST,
+    )
+
+
+def check_category_names(valid):
+    # One query for every name of the batch, plus duplicates within it
+    names = [serializer.validated_data.get("name") for _, serializer in valid]
+    taken = dict(Category.objects.filter(name__in=names).values_list("name", "id"))
+    errors, seen = [], set()
+    for index, serializer in valid:
+        name = serializer.validated_data.get("name")
+        own_id = serializer.instance.id if serializer.instance else None
+        if taken.get(name, own_id) != own_id or name in seen:
+            errors.append(
+                {"index": index, "errors": {"name": [f"data with name {name} already exist"]}}
+            )
+        seen.add(name)
+    return errors
+
+
+def check_product_categories(valid):
+    # One query for every category referenced by the batch
+    category_ids = {serializer.validated_data["category_id"] for _, serializer in valid}
+    existing = set(Category.objects.filter(id__in=category_ids).values_list("id", flat=True))
+    errors = []
+    for index, serializer in valid:
+        category_id = serializer.validated_data["category_id"]
+        if category_id not in existing:
+            errors.append(
+                {
+                    "index": index,
+                    "errors": {"category": [f"Category with id {category_id} does not exist"]},
+                }
+            )
+    return errors
+
+
+@api_view(["POST", "PUT", "DELETE"])
+def categories_bulk_view(request):
+    error_response = check_bulk_items(request)
+    if error_response:
+        return error_response
+
+    # Delete categories by ID
+    if request.method == "DELETE":
+        product_ids = list(
+            Product.objects.filter(category_id__in=filter(None, map(as_id, request.data)))
+            .values_list("id", flat=True)
+        )
+        ids, errors = bulk_delete(request, Category)
+        cache.delete_many(
+            [category_key(id) for id in ids] + [product_key(id) for id in product_ids]
+        )
+        invalidate_categories()
+        invalidate_products()
+        return bulk_response(ids, errors)
+
+    # Create or update categories
+    try:
+        results, errors = bulk_write(
+            request,
+            Category,
+            CategoryBulkSerializer,
+            CategorySerializer,
+            check_category_names,
+            ["name", "description"],
+        )
+    except IntegrityError as e:
+        return response_wrapper(message=str(e), status_code=status.HTTP_400_BAD_REQUEST)
+    if results:
+        cache.delete_many([category_key(category["id"]) for category in results])
+        invalidate_categories()
+        if request.method == "PUT":
+            # Cached product filters resolved the old category names
+            invalidate_products()
+    success_status = status.HTTP_201_CREATED if request.method == "POST" else status.HTTP_200_OK
+    return bulk_response(results, errors, success_status)
+
+
+def delete_products(ids):
+    """Delete products, then update the stats and tombstones once.
+
+    The ``post_delete`` receivers skip the products of a queryset delete,
+    so the batch costs the same whatever its size.
+    """
+    products = Product.objects.filter(id__in=ids)
+    category_ids = set(products.values_list("category_id", flat=True))
+    products.delete()
+    rebuild_category_stats(category_ids)
+    record_deleted(ids)
+
+
+@api_view(["POST", "PUT", "DELETE"])
+def products_bulk_view(request):
+    error_response = check_bulk_items(request)
+    if error_response:
+        return error_response
+
+    # Delete products by ID
+    if request.method == "DELETE":
+        ids, errors = bulk_delete(request, Product, delete_products)
+        cache.delete_many([product_key(id) for id in ids])
+        invalidate_products()
+        return bulk_response(ids, errors)
+
+    # Create or update products
+    category_ids = set()
+    if request.method == "PUT":
+        # Updates may move products out of these categories
+        ids = [as_id(item.get("id")) for item in request.data if isinstance(item, dict)]
+        category_ids.update(
+            Product.objects.filter(id__in=filter(None, ids)).values_list("category_id", flat=True)
+        )
+
+    def update_stats(objs):
+        # bulk_create() and bulk_update() bypass the stats signals
+        rebuild_category_stats(category_ids | {obj.category_id for obj in objs})
+
+    results, errors = bulk_write(
+        request,
+        Product,
+        ProductBulkSerializer,
+        ProductSerializer,
+        check_product_categories,
+        ["name", "description", "price", "category", "update_at"],
+        on_write=update_stats,
+    )
+    if results:
+        cache.delete_many([product_key(product["id"]) for product in results])
+        invalidate_products()
+    success_status = status.HTTP_201_CREATED if request.method == "POST" else status.HTTP_200_OK
+    return bulk_response(results, errors, success_status)
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(products):
+    # iterator() keeps memory flat: rows are fetched chunk by chunk and never
+    # cached on the queryset.
+    rows = product_rows.values(products.order_by("id"))
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield product_rows.to_representation(row)
+
+
+def export_ndjson(products):
+    for row in export_rows(products):
+        yield json.dumps(row) + "\n"
+
+
+def export_csv(products):
+    writer = csv.writer(Echo())
+    fields = [name for name, _ in product_rows.columns]
+    yield writer.writerow(fields)
+    for row in export_rows(products):
+        yield writer.writerow([row[field] for field in fields])
+
+
+EXPORT_FORMATS = {
+    "ndjson": (export_ndjson, "application/x-ndjson"),
+    "csv": (export_csv, "text/csv"),
+}
+
+
+# A plain Django view: DRF would treat ?format= as a renderer override and
+# buffer the whole body.
+@require_GET
+def products_export_view(request):
+    export_format = request.GET.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse(
+            {"data": None, "message": f"Unknown export format {export_format}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        products = filter_products(product_filters(request.GET))
+    except ValueError:
+        return JsonResponse(
+            {"data": None, "message": "Invalid price filter values"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    except Category.DoesNotExist:
+        return JsonResponse(
+            {
+                "data": None,
+                "message": f"Category with name '{request.GET['category_name']}' not found",
+            },
+            status=status.HTTP_404_NOT_FOUND,
+        )
+    stream, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(stream(products), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="products.{export_format}"'
+    return response
+
+
+@require_GET
+def metrics_view(request):
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4")
@@ -0,0 +1,128 @@
+"""Cache warming: rebuild the hot lists before users ask for them.
+
+``warm_caches`` fills the full product and category lists, the product list
+of every category and the most requested filter combinations. It runs from
+``manage.py warm_cache`` after a deploy and, with
+``STORE_CACHE_REFRESH_ON_WRITE``, in a background thread after each write.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+from .cache import CATEGORIES_KEY, PRODUCTS_KEY, versioned_key
+from .filters import filter_key, filter_products, product_filters
+from .lists import category_list, product_list, rebuild_list
+from .models import Category
+from .serializers import product_rows
+
+logger = logging.getLogger(__name__)
+
+POPULAR_FILTERS_KEY = "store:popular-filters"
+MAX_TRACKED_FILTERS = 200
+DEFAULT_WARM_TOP = 20
+
+
+def record_filter(filters):
+    """Count a rebuild of the filtered product list for ``filters``.
+
+    Only rebuilds are counted, i.e. how often a combination was requested
+    while not cached, which is the work warming saves. Updates are not
+    atomic, so concurrent rebuilds may lose counts; a ranking does not need
+    them.
+    """
+    counts = cache.get(POPULAR_FILTERS_KEY) or {}
+    _count(counts, filter_key(filters))
+    cache.set(POPULAR_FILTERS_KEY, counts, timeout=None)
+
+
+async def arecord_filter(filters):
+    """Async version of ``record_filter``."""
+    counts = await cache.aget(POPULAR_FILTERS_KEY) or {}
+    _count(counts, filter_key(filters))
+    await cache.aset(POPULAR_FILTERS_KEY, counts, timeout=None)
+
+
+def _count(counts, key):
+    counts[key] = counts.get(key, 0) + 1
+    if len(counts) > MAX_TRACKED_FILTERS:
+        # Halve every count so combinations that fell out of use age away
+        for name, count in list(counts.items()):
+            if count > 1:
+                counts[name] = count // 2
+            else:
+                del counts[name]
+
+
+def popular_filters(top):
+    """Return the ``top`` most rebuilt filter combinations, most rebuilt first."""
+    counts = cache.get(POPULAR_FILTERS_KEY) or {}
+    ranked = sorted(counts, key=counts.get, reverse=True)[:top]
+    return [product_filters(dict(parse_qsl(key))) for key in ranked]
+
+
+def warm_filtered(filters):
+    rebuild_list(
+        PRODUCTS_KEY,
+        lambda: product_rows.serialize(filter_products(filters)),
+        key=versioned_key(PRODUCTS_KEY, "filter", filter_key(filters)),
+    )
+
+
+def warm_caches(top=DEFAULT_WARM_TOP):
+    """Build every warmable list that is not cached; return how many were visited."""
+    rebuild_list(PRODUCTS_KEY, product_list)
+    rebuild_list(CATEGORIES_KEY, category_list)
+    combinations = [
+        product_filters({"category_name": name})
+        for name in Category.objects.order_by("id").values_list("name", flat=True)
+    ]
+    combinations += [f for f in popular_filters(top) if f not in combinations]
+    for filters in combinations:
+        try:
+            warm_filtered(filters)
+        except (Category.DoesNotExist, Category.MultipleObjectsReturned):
+            # A recorded category name that no longer resolves to one category
+            pass
+    return 2 + len(combinations)
+
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store-warm")
+_lock = threading.Lock()
+_queued = False
+
+
+def schedule_warm():
+    """Warm the caches in the background.
+
+    Writes arriving while a refresh is queued share it, so a burst of writes
+    costs one refresh after the one in progress.
+    """
+    global _queued
+    with _lock:
+        if _queued:
+            return None
+        _queued = True
+    return _executor.submit(_warm)
+
+
+def _warm():
+    global _queued
+    with _lock:
+        _queued = False
+    try:
+        warm_caches(getattr(settings, "STORE_CACHE_WARM_TOP", DEFAULT_WARM_TOP))
+    except Exception:
+        logger.exception("Background cache refresh failed")
+    finally:
+        connections.close_all()
+
+
+def refresh_on_write(sender, namespace, **kwargs):
+    """``invalidated`` receiver rebuilding the caches once the write commits."""
+    if getattr(settings, "STORE_CACHE_REFRESH_ON_WRITE", False):
+        transaction.on_commit(schedule_warm)